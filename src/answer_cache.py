@@ -0,0 +1,128 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+import numpy as np
+
+CachedAnswer = namedtuple("CachedAnswer", ["answer", "question", "created", "similarity"])
+
+_NON_WORD = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question):
+    return _WHITESPACE.sub(" ", _NON_WORD.sub(" ", question.lower())).strip()
+
+def context_fingerprint(context):
+    return hashlib.sha256(context.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """In-memory cache of chat answers shared by every session in the process.
+
+    Answers are keyed by guide, model, normalized question and a fingerprint of the
+    retrieved context, so an answer is only reused when the model would have seen
+    the same prompt. With an embedder, a question that misses exactly is compared
+    against the cached questions with the same guide, model and context, and a
+    close enough paraphrase is a hit too. Entries expire after ttl seconds and the
+    least recently used ones are evicted beyond max_entries.
+    """
+
+    def __init__(self, max_entries=1024, ttl=86400, embedder=None, similarity_threshold=0.92):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+        self.logger = logging.getLogger(f"streamlit_logger.{__name__}")
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> (answer, question, created, vector)
+        self._entries = OrderedDict()
+
+    def get(self, guide, model, question, context):
+        scope = (guide, model, context_fingerprint(context))
+        key = (*scope, normalize_question(question))
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return CachedAnswer(entry[0], entry[1], entry[2], 1.0)
+            candidates = [(k, e) for k, e in self._entries.items() if k[:3] == scope and e[3] is not None]
+        match = self._closest(question, candidates) if candidates and self.embedder is not None else None
+        with self._lock:
+            if match is None or match[0] not in self._entries:
+                self.misses += 1
+                return None
+            matched_key, similarity = match
+            self._entries.move_to_end(matched_key)
+            self.hits += 1
+            answer, cached_question, created, _ = self._entries[matched_key]
+        self.logger.info("Answer cache paraphrase hit (%.3f): %r ~ %r", similarity, question, cached_question)
+        return CachedAnswer(answer, cached_question, created, similarity)
+
+    def put(self, guide, model, question, context, answer):
+        key = (guide, model, context_fingerprint(context), normalize_question(question))
+        vector = self._embed(question) if self.embedder is not None else None
+        with self._lock:
+            self._entries[key] = (answer, question, time.time(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self, guide=None):
+        with self._lock:
+            if guide is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == guide]:
+                    del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def _closest(self, question, candidates):
+        try:
+            vector = self._embed(question)
+        except Exception as e:
+            self.logger.warning("Skipping paraphrase lookup: %s", e)
+            return None
+        similarities = np.stack([entry[3] for _, entry in candidates]) @ vector
+        best = int(similarities.argmax())
+        if similarities[best] < self.similarity_threshold:
+            return None
+        return candidates[best][0], float(similarities[best])
+
+    def _embed(self, question):
+        vector = self.embedder.encode([question], normalize_embeddings=True, convert_to_numpy=True,
+                                      show_progress_bar=False)
+        return np.asarray(vector, dtype=np.float32).ravel()
+
+    def _expire(self):
+        if not self.ttl:
+            return
+        cutoff = time.time() - self.ttl
+        # Entries are refreshed on use, but expiry is by creation time, so scan them all
+        for key in [key for key, entry in self._entries.items() if entry[2] < cutoff]:
+            del self._entries[key]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_answer_cache(embedder=None):
+    """Return the answer cache shared by every session in this process."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnswerCache(max_entries=int(os.environ.get('ANSWER_CACHE_SIZE', 1024)),
+                                 ttl=float(os.environ.get('ANSWER_CACHE_TTL', 86400)))
+        if embedder is not None and _cache.embedder is None:
+            _cache.embedder = embedder
+        return _cache
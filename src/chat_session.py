@@ -1,47 +1,168 @@
+import asyncio
+import json
+import re
+import time
 import streamlit as st
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import ollama
 from streamlit_logger import get_logger
+from ollama_client import get_ollama_client, OllamaError
+from retrieval_index import RetrievalIndex, DenseIndex, assemble_context
+from model_registry import get_model_registry, EMBEDDING_MODEL
+from answer_cache import get_answer_cache
+from conversation_memory import ConversationMemory
+
+# Cached answers are replayed in word-sized pieces, like the model streams them
+_REPLAY_PIECE = re.compile(r"\s*\S+")
 
 class ChatSession:
-    def __init__(self, materials, ollama_model):
+    def __init__(self, materials, ollama_model, source_texts=None, top_k=5, min_score=0.05, context_tokens=1500,
+                 retrieval_mode="tfidf", embeddings_path=None, tfidf_path=None, guide=None, use_answer_cache=True,
+                 history_tokens=1024, history_page_size=20):
         self.materials = materials
+        self.guide = guide
+        self.retrieval_mode = retrieval_mode
+        self.embeddings_path = embeddings_path
+        self.tfidf_path = tfidf_path
         self.ollama_model = ollama_model
+        self.top_k = top_k
+        self.min_score = min_score
+        self.context_tokens = context_tokens
         self.logger = get_logger(f"streamlit_logger.{__name__}")
-        self.vectorizer = TfidfVectorizer()
-        self.vector_embeddings = self._generate_embeddings(materials)
+        self.index = self._build_index(materials, source_texts or [])
+        self.history_page_size = history_page_size
+        self.memory = ConversationMemory(self._summarize_turns, token_budget=history_tokens, logger=self.logger)
+        self.answer_cache = None
+        if use_answer_cache:
+            # Paraphrase lookup reuses the embedder when dense retrieval has it loaded anyway
+            embedder = self.index.dense.embedder if self.index.dense is not None else None
+            self.answer_cache = get_answer_cache(embedder)
+        # Timing of the most recent answer: time to first token and generation speed
+        self.last_metrics = None
         self.logger.info("Chat session initialized with model: %s", self.ollama_model)
-        self.logger.info("Size of embeddings: %s", self.vector_embeddings.shape)
+        self.logger.info("Size of retrieval index: %d chunks", len(self.index.chunks))
+
+    def _build_index(self, materials, source_texts):
+        dense = None
+        if self.retrieval_mode != "tfidf":
+            # The MiniLM embedder is only loaded when dense retrieval is enabled
+            dense = DenseIndex(get_model_registry().proxy('embedder'), self.embeddings_path, model_id=EMBEDDING_MODEL,
+                               logger=self.logger)
+        index = RetrievalIndex(logger=self.logger, dense=dense, mode=self.retrieval_mode,
+                               tfidf_path=self.tfidf_path)
+        index.add_texts(materials, "summary")
+        index.add_texts(source_texts, "source")
+        return index.build()
+
+    def _find_relevant_context(self, question):
+        results = self.index.search(question, k=self.top_k, min_score=self.min_score)
+        self.logger.info("Retrieved %d chunks, top score %s", len(results), round(results[0][0], 3) if results else None)
+        return assemble_context(results, self.context_tokens)
+
+    async def stream_answer(self, question):
+        """Yield the answer piece by piece as the model generates it."""
+        self.last_metrics = None
+        relevant_material = self._find_relevant_context(question)
+        history = self.memory.messages()
+        # The key covers the history too, or a follow-up like "Why?" would get another conversation's answer
+        cache_context = self._cache_context(relevant_material, history)
+        cached = self._cached_answer(question, cache_context)
+        if cached is not None:
+            started = time.monotonic()
+            pieces = _REPLAY_PIECE.findall(cached.answer) or [cached.answer]
+            for piece in pieces:
+                yield piece
+            self.last_metrics = {"time_to_first_token": 0.0, "tokens": len(pieces), "tokens_per_second": None,
+                                 "total_time": round(time.monotonic() - started, 3), "cached": True}
+            self._remember(question, cached.answer)
+            return
+        message = {'role': 'user', 'content': f"{question}\n\nContext: {relevant_material}"}
+        client = get_ollama_client()
+        started = time.monotonic()
+        first_token_at = None
+        pieces = 0
+        final = {}
+        answer = []
+        async for part in client.chat_stream(self.ollama_model, [*history, message]):
+            content = part.get('message', {}).get('content', '')
+            if content:
+                if first_token_at is None:
+                    first_token_at = time.monotonic()
+                pieces += 1
+                answer.append(content)
+                yield content
+            if part.get('done'):
+                final = part
+        # Only complete answers are cached; an interrupted stream never reaches this point
+        if self.answer_cache is not None and answer:
+            self.answer_cache.put(self.guide, self.ollama_model, question, cache_context, "".join(answer))
+        self._remember(question, "".join(answer))
+        self.last_metrics = self._answer_metrics(started, first_token_at, pieces, final)
+        self.logger.info("Answer metrics: %s", self.last_metrics)
 
-    def _generate_embeddings(self, materials):
-        embeddings = self.vectorizer.fit_transform(materials)
-        self.logger.info("Generated embeddings for materials")
-        return embeddings
+    def _remember(self, question, answer):
+        # History keeps the bare question; retrieved context is added afresh for each new question
+        self.memory.add('user', question)
+        self.memory.add('assistant', answer)
 
-    def _find_most_relevant_material(self, question):
-        question_embedding = self.vectorizer.transform([question])
-        similarities = cosine_similarity(question_embedding, self.vector_embeddings)
-        most_relevant_index = similarities.argmax()
-        self.logger.info("Most relevant material index: %s", most_relevant_index)
-        return self.materials[most_relevant_index]
+    def _summarize_turns(self, summary, turns):
+        # Runs on the memory's background thread, which has no event loop of its own
+        transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+        prompt = ("Update the summary of this study conversation with the new turns. Keep the topics, questions "
+                  "and key facts, in at most 150 words.\n\n"
+                  f"Current summary: {summary or '(none)'}\n\nNew turns:\n{transcript}")
+        response = asyncio.run(get_ollama_client().chat(self.ollama_model, [{'role': 'user', 'content': prompt}]))
+        return response.get('message', {}).get('content', '').strip() or summary
+
+    def _cache_context(self, relevant_material, history):
+        if not history:
+            return relevant_material
+        # Only opening questions share answers across conversations
+        return f"{relevant_material}\0{json.dumps(history, sort_keys=True)}"
+
+    def _cached_answer(self, question, context):
+        if self.answer_cache is None:
+            return None
+        cached = self.answer_cache.get(self.guide, self.ollama_model, question, context)
+        if cached is not None:
+            self.logger.info("Answering from cache (similarity %.3f)", cached.similarity)
+        return cached
+
+    def _answer_metrics(self, started, first_token_at, pieces, final):
+        finished = time.monotonic()
+        # Ollama reports exact token counts and durations (in ns) on the final chunk
+        tokens = final.get('eval_count') or pieces
+        if final.get('eval_duration'):
+            generation_time = final['eval_duration'] / 1e9
+        else:
+            generation_time = finished - (first_token_at or finished)
+        return {
+            "time_to_first_token": round(first_token_at - started, 3) if first_token_at else None,
+            "tokens": tokens,
+            "tokens_per_second": round(tokens / generation_time, 1) if generation_time > 0 else None,
+            "total_time": round(finished - started, 3),
+        }
 
     async def ask_question(self, question):
         try:
-            relevant_material = self._find_most_relevant_material(question)
-            message = {'role': 'user', 'content': f"{question}\n\nContext: {relevant_material}"}
-            client = ollama.AsyncClient()
-            response = await client.chat(model=self.ollama_model, messages=[message], stream=True)
-            answer = ""
-            async for part in response:
-                if 'role' in part and part['role'] == 'assistant':
-                    answer += part['content']
-            return answer
-        except ollama.ResponseError as e:
+            return "".join([piece async for piece in self.stream_answer(question)])
+        except OllamaError as e:
             self.logger.error("Error in response: %s", e)
             st.error(f"Error in response: {e}")
             return "Error in response."
 
+    async def _render_answer(self, question):
+        placeholder = st.empty()
+        answer = ""
+        try:
+            async for piece in self.stream_answer(question):
+                answer += piece
+                placeholder.markdown(answer + "▌")
+        except OllamaError as e:
+            self.logger.error("Error in response: %s", e)
+            st.error(f"Error in response: {e}")
+            answer = answer or "Error in response."
+        placeholder.markdown(answer)
+        return answer
+
     async def start_chat(self):
         st.markdown(
             "<h2 style='text-align: center; color: #4CAF50; font-family: Arial;'>Hermione🪶</h2>",
@@ -54,8 +175,14 @@ class ChatSession:
                 {"role": "assistant", "content": "Hi! How may I help you with your study materials?"}
             ]
 
-        # Display the chat history
-        for message in st.session_state.messages:
+        # Display the chat history a page at a time, latest page first
+        messages = st.session_state.messages
+        pages = max(1, -(-len(messages) // self.history_page_size))
+        page = pages
+        if pages > 1:
+            page = st.number_input("History page", min_value=1, max_value=pages, value=pages, step=1)
+        start = (page - 1) * self.history_page_size
+        for message in messages[start:start + self.history_page_size]:
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
 
@@ -72,15 +199,17 @@ class ChatSession:
                 st.write("Ending the chat session.")
                 return
             
-            # Generate assistant response
-            answer = await self.ask_question(user_input)
-            
+            # Stream the assistant response into the chat as it is generated
+            with st.chat_message("assistant"):
+                answer = await self._render_answer(user_input)
+                if self.last_metrics and self.last_metrics.get("cached"):
+                    st.caption("Cached answer")
+                elif self.last_metrics and self.last_metrics["time_to_first_token"] is not None:
+                    st.caption(f"First token after {self.last_metrics['time_to_first_token']}s · "
+                               f"{self.last_metrics['tokens_per_second']} tokens/s")
+
             # Add assistant response to session state
             st.session_state.messages.append({"role": "assistant", "content": answer})
-            
-            # Display assistant response
-            with st.chat_message("assistant"):
-                st.markdown(answer)
 
 # Example usage
 # if __name__ == "__main__":
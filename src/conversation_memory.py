@@ -0,0 +1,77 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from retrieval_index import estimate_tokens
+
+
+class ConversationMemory:
+    """Recent chat turns within a token budget, plus a rolling summary of everything older.
+
+    Turns that fall out of the window are folded into the summary by
+    summarize(summary, turns) on a background thread. Building a prompt never
+    waits for it: until the new summary is ready the previous one is used, so
+    prompt size and latency stay flat however long the conversation gets.
+    """
+
+    def __init__(self, summarize=None, token_budget=1024, logger=None):
+        self.summarize = summarize
+        self.token_budget = token_budget
+        self.logger = logger or logging.getLogger(f"streamlit_logger.{__name__}")
+        self.turns = []
+        self.summary = ""
+        # Turns before this index are covered by the summary
+        self.summarized = 0
+        self._window_start = 0
+        self._lock = threading.Lock()
+        self._job = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-summary")
+
+    def add(self, role, content):
+        with self._lock:
+            self.turns.append({"role": role, "content": content})
+            self._window_start = self._fit_window()
+        self._schedule_summary()
+
+    def messages(self):
+        """Return the history to send before the next question: summary first, then recent turns."""
+        with self._lock:
+            history = self.turns[self._window_start:]
+            summary = self.summary
+        if summary:
+            return [{"role": "system", "content": f"Summary of the conversation so far: {summary}"}, *history]
+        return list(history)
+
+    def _fit_window(self):
+        used = 0
+        start = len(self.turns)
+        while start > self.summarized and used + estimate_tokens(self.turns[start - 1]["content"]) <= self.token_budget:
+            start -= 1
+            used += estimate_tokens(self.turns[start]["content"])
+        return start
+
+    def _schedule_summary(self):
+        if self.summarize is None:
+            return
+        with self._lock:
+            if self._job is not None and not self._job.done():
+                # The running job picks the remaining turns up when it finishes
+                return
+            if self._window_start <= self.summarized:
+                return
+            upto = self._window_start
+            self._job = self._executor.submit(self._update_summary, self.summary, self.turns[self.summarized:upto], upto)
+
+    def _update_summary(self, summary, turns, upto):
+        try:
+            new_summary = self.summarize(summary, turns)
+        except Exception as e:
+            self.logger.warning("Could not update the conversation summary: %s", e)
+            return
+        with self._lock:
+            self.summary = new_summary
+            self.summarized = upto
+            self._window_start = max(self._window_start, upto)
+        self.logger.info("Conversation summary now covers %d turns", upto)
+        # Turns may have left the window while this job was running
+        self._job = None
+        self._schedule_summary()
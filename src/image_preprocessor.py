@@ -0,0 +1,115 @@
+import hashlib
+import io
+import json
+import os
+import numpy as np
+from PIL import Image, ImageChops, ImageOps
+
+
+class ImagePreprocessor:
+    """Shrink and clean up images before they are sent to the vision model.
+
+    Results are cached on disk by a hash of the original bytes and the settings,
+    so each image is only processed once.
+    """
+
+    def __init__(self, max_dimension=1120, grayscale=True, autocrop=True, deskew=True, max_skew=5.0,
+                 image_format="JPEG", quality=85):
+        # llama3.2-vision tiles images into at most 1120x1120 pixels, so anything larger is wasted payload
+        self.max_dimension = max_dimension
+        self.grayscale = grayscale
+        self.autocrop = autocrop
+        self.deskew = deskew
+        self.max_skew = max_skew
+        self.image_format = image_format
+        self.quality = quality
+
+    def settings_key(self):
+        settings = [self.max_dimension, self.grayscale, self.autocrop, self.deskew, self.max_skew,
+                    self.image_format, self.quality]
+        return hashlib.sha256(json.dumps(settings).encode("utf-8")).hexdigest()[:12]
+
+    def process_file(self, image_path, content_hash=None):
+        """Return the processed bytes for an image file, caching them next to the study guide."""
+        cache_dir = os.path.join(os.path.dirname(image_path), ".cache", "ocr-images")
+        cached_path = self._cached_path(cache_dir, content_hash) if content_hash else None
+        if cached_path and os.path.exists(cached_path):
+            with open(cached_path, "rb") as file:
+                return file.read()
+        with open(image_path, "rb") as file:
+            return self.process_bytes(file.read(), cache_dir, content_hash)
+
+    def process_bytes(self, data, cache_dir, content_hash=None):
+        content_hash = content_hash or hashlib.sha256(data).hexdigest()
+        cached_path = self._cached_path(cache_dir, content_hash)
+        if os.path.exists(cached_path):
+            with open(cached_path, "rb") as file:
+                return file.read()
+        processed = self.transform(data)
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = f"{cached_path}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(processed)
+        os.replace(temp_path, cached_path)
+        return processed
+
+    def transform(self, data):
+        with Image.open(io.BytesIO(data)) as original:
+            # Phone photos are often stored sideways with an EXIF rotation flag
+            image = ImageOps.exif_transpose(original)
+            image = image.convert("L" if self.grayscale else "RGB")
+        if self.autocrop:
+            image = self._crop_margins(image)
+        if self.deskew:
+            angle = self._estimate_skew(image)
+            if abs(angle) >= 0.5:
+                image = image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=self._background(image))
+        image.thumbnail((self.max_dimension, self.max_dimension), Image.LANCZOS)
+        buffer = io.BytesIO()
+        if self.image_format == "JPEG":
+            image.save(buffer, format="JPEG", quality=self.quality, optimize=True)
+        else:
+            image.save(buffer, format=self.image_format)
+        original_size = len(data)
+        if buffer.tell() >= original_size:
+            # Re-encoding made it bigger, so the original is the better payload
+            return data
+        return buffer.getvalue()
+
+    def _cached_path(self, cache_dir, content_hash):
+        extension = "jpg" if self.image_format == "JPEG" else self.image_format.lower()
+        return os.path.join(cache_dir, f"{content_hash}-{self.settings_key()}.{extension}")
+
+    def _background(self, image):
+        return 255 if image.mode == "L" else (255, 255, 255)
+
+    def _crop_margins(self, image, threshold=40, margin=16):
+        # Treat the top-left corner as the page background and crop to everything that differs from it
+        background = Image.new(image.mode, image.size, image.getpixel((0, 0)))
+        difference = ImageChops.difference(image, background).convert("L")
+        bbox = difference.point(lambda p: 255 if p > threshold else 0).getbbox()
+        if not bbox:
+            return image
+        left, top, right, bottom = bbox
+        bbox = (max(0, left - margin), max(0, top - margin),
+                min(image.width, right + margin), min(image.height, bottom + margin))
+        # Only crop when it removes a meaningful border
+        cropped_area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+        if cropped_area > 0.95 * image.width * image.height:
+            return image
+        return image.crop(bbox)
+
+    def _estimate_skew(self, image):
+        # Text lines give the sharpest row-by-row ink profile when they are horizontal
+        sample = image.convert("L")
+        sample.thumbnail((800, 800))
+        best_angle, best_score = 0.0, None
+        steps = int(self.max_skew * 2)
+        for step in range(-steps, steps + 1):
+            angle = step / 2
+            rotated = sample.rotate(angle, resample=Image.BILINEAR, fillcolor=255)
+            rows = (np.asarray(rotated) < 128).sum(axis=1).astype(np.float64)
+            score = float(np.sum(np.diff(rows) ** 2))
+            if best_score is None or score > best_score:
+                best_angle, best_score = angle, score
+        return best_angle
@@ -0,0 +1,234 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+JOB_STATES = ("queued", "running", "completed", "failed", "cancelled")
+ACTIVE_STATES = ("queued", "running")
+
+
+class JobCancelled(BaseException):
+    """Raised from a job's progress reports once cancellation was requested.
+
+    It is not an Exception, so error handling inside the job does not swallow it.
+    """
+
+
+class JobContext:
+    """Handed to a job handler to report progress and notice cancellation."""
+
+    def __init__(self, queue, job):
+        self.queue = queue
+        self.job = job
+
+    def progress(self, stage, done, total):
+        """Record progress for one stage of the job; raises JobCancelled if the job was cancelled."""
+        self.job["progress"][stage] = [done, total]
+        self.queue._update(self.job["id"], progress=json.dumps(self.job["progress"]))
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        if self.queue._cancel_requested(self.job["id"]):
+            raise JobCancelled()
+
+
+class JobQueue:
+    """Persistent queue of long-running study guide jobs, run by a pool of background threads.
+
+    Jobs live in a SQLite table, so their status and progress survive reruns and
+    browser disconnects and can be polled from any session. Jobs that were running
+    when the process stopped are queued again on start. Handlers are expected to be
+    resumable, skipping work already done: OCR skips files in the manifest and
+    material generation reuses the material cache.
+    """
+
+    def __init__(self, path, workers=2):
+        self.path = path
+        self.workers = max(1, workers)
+        self.logger = logging.getLogger(f"streamlit_logger.{__name__}")
+        self._handlers = {}
+        self._wakeup = threading.Condition()
+        self._threads = []
+        # Guides with a job running in this process; one job per guide at a time
+        self._busy_guides = set()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                guide TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress TEXT NOT NULL DEFAULT '{}',
+                error TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL,
+                updated REAL NOT NULL)""")
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_guide ON jobs (guide, created)")
+
+    def register(self, kind, handler):
+        """handler(guide, context) runs the job in a worker thread."""
+        self._handlers[kind] = handler
+
+    def start(self):
+        if self._threads:
+            return
+        with self._connect() as connection:
+            # Whatever was running when the last process stopped is picked up again
+            resumed = connection.execute("UPDATE jobs SET status = 'queued', updated = ? WHERE status = 'running'",
+                                         (time.time(),)).rowcount
+        if resumed:
+            self.logger.info("Resuming %d interrupted jobs", resumed)
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, kind, guide):
+        """Queue a job and return its id; an identical job that is still queued or running is reused."""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT id FROM jobs WHERE kind = ? AND guide = ? AND status IN ('queued', 'running')",
+                (kind, guide)).fetchone()
+            if row:
+                return row[0]
+            now = time.time()
+            job_id = connection.execute(
+                "INSERT INTO jobs (kind, guide, status, created, updated) VALUES (?, ?, 'queued', ?, ?)",
+                (kind, guide, now, now)).lastrowid
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def cancel(self, job_id):
+        with self._connect() as connection:
+            # Queued jobs are cancelled outright; running ones stop at their next progress report
+            connection.execute("UPDATE jobs SET status = 'cancelled', updated = ? WHERE id = ? AND status = 'queued'",
+                               (time.time(), job_id))
+            connection.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+
+    def get(self, job_id):
+        with self._connect() as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def jobs(self, guide=None, limit=20):
+        """Return the most recent jobs, newest first."""
+        query = "SELECT * FROM jobs"
+        params = []
+        if guide is not None:
+            query += " WHERE guide = ?"
+            params.append(guide)
+        query += " ORDER BY created DESC LIMIT ?"
+        params.append(limit)
+        with self._connect() as connection:
+            return [self._job(row) for row in connection.execute(query, params)]
+
+    def _work(self):
+        while True:
+            job = self._claim()
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(timeout=2)
+                continue
+            try:
+                self._run(job)
+            finally:
+                with self._wakeup:
+                    self._busy_guides.discard(job["guide"])
+                    # Another job for this guide may have been waiting on it
+                    self._wakeup.notify_all()
+
+    def _claim(self):
+        with self._wakeup:
+            with self._connect() as connection:
+                rows = connection.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY created").fetchall()
+                for row in rows:
+                    job = self._job(row)
+                    # Jobs for the same guide would step on each other's files
+                    if job["guide"] in self._busy_guides:
+                        continue
+                    claimed = connection.execute(
+                        "UPDATE jobs SET status = 'running', updated = ? WHERE id = ? AND status = 'queued'",
+                        (time.time(), job["id"])).rowcount
+                    if claimed:
+                        self._busy_guides.add(job["guide"])
+                        job["status"] = "running"
+                        return job
+        return None
+
+    def _run(self, job):
+        self.logger.info("Starting %s job %d for '%s'", job["kind"], job["id"], job["guide"])
+        context = JobContext(self, job)
+        try:
+            context.check_cancelled()
+            self._handlers[job["kind"]](job["guide"], context)
+        except JobCancelled:
+            self.logger.info("Cancelled %s job %d", job["kind"], job["id"])
+            self._update(job["id"], status="cancelled")
+        except Exception as e:
+            self.logger.error("%s job %d failed: %s", job["kind"], job["id"], e)
+            self._update(job["id"], status="failed", error=str(e))
+        else:
+            self._update(job["id"], status="completed")
+
+    def _cancel_requested(self, job_id):
+        with self._connect() as connection:
+            row = connection.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def _update(self, job_id, **fields):
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as connection:
+            connection.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def _job(self, row):
+        job = dict(row)
+        job["progress"] = json.loads(job["progress"])
+        return job
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+
+def _run_ocr(guide, context):
+    from ocr_processor import OCRProcessor
+    # Each job gets its own event loop on the worker thread
+    asyncio.run(OCRProcessor().process_study_guide(
+        guide, progress_callback=lambda done, total: context.progress('ocr', done, total)))
+    context.check_cancelled()
+
+def _run_materials(guide, context):
+    from materials_generator import MaterialGenerator
+    from study_guide_catalog import get_study_guide_catalog
+    listing = get_study_guide_catalog().guide(guide)
+    generator = MaterialGenerator(output_file=os.path.join(listing.path, 'materials.json'))
+    generator.generate_materials(listing.texts(), progress_callback=context.progress)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """Return the job queue shared by every session in this process, starting its workers on first use."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue(os.path.join("study_guides", ".jobs.sqlite"), workers=int(os.environ.get('JOB_WORKERS', 2)))
+            _queue.register('ocr', _run_ocr)
+            _queue.register('materials', _run_materials)
+            _queue.start()
+        return _queue
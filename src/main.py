@@ -1,21 +1,16 @@
 import streamlit as st
-import base64
-import requests
-from PIL import Image
+import hashlib
 import os
-import json
-from sentence_transformers import SentenceTransformer
-from transformers import pipeline, BartTokenizer, BartForConditionalGeneration
-from collections import Counter
-from sklearn.feature_extraction.text import TfidfVectorizer
 import asyncio
 import nest_asyncio
-import ollama
-import PyPDF2
-from streamlit_logger import get_logger
 from chat_session import ChatSession
 from materials_generator import MaterialGenerator
-from ocr_processor import OCRProcessor
+from study_guide_catalog import get_study_guide_catalog
+from thumbnails import get_thumbnail_cache
+from materials_view import MaterialsView
+from ollama_client import get_ollama_client
+from job_queue import get_job_queue
+from ocr_manifest import hash_file
 
 # Apply nest_asyncio to allow nested event loops
 nest_asyncio.apply()
@@ -30,6 +25,61 @@ class StudyGuideAction:
     CREATE_NEW_STUDY_GUIDE = "Create New Study Guide"
     DELETE_STUDY_GUIDE = "Delete Study Guide"  
 
+# Labels for the progress stages of background jobs; material stages are keyed by their materials section
+MATERIAL_STAGES = {
+    'ocr': "OCR",
+    'summaries': "Summaries",
+    'vocab_list': "Vocabulary",
+    'practice_questions': "Practice questions",
+}
+
+JOB_LABELS = {'ocr': "OCR", 'materials': "Study materials"}
+
+# Only this many thumbnails are loaded at once; the rest are a page away
+SIDEBAR_THUMBNAILS = 8
+GALLERY_PAGE_SIZE = 24
+
+
+def save_upload(study_guide_dir, uploaded_file):
+    """Write an uploaded file into the guide unless the same content is already there.
+
+    The uploader hands back every file on each rerun; rewriting them would bump their
+    mtime and make the OCR manifest hash them all again.
+    """
+    saved = st.session_state.setdefault("saved_uploads", set())
+    key = (study_guide_dir, uploaded_file.file_id)
+    if key in saved:
+        return
+    path = os.path.join(study_guide_dir, uploaded_file.name)
+    data = uploaded_file.getbuffer()
+    if not (os.path.exists(path) and os.path.getsize(path) == uploaded_file.size
+            and hash_file(path) == hashlib.sha256(data).hexdigest()):
+        with open(path, "wb") as f:
+            f.write(data)
+    saved.add(key)
+
+
+@st.fragment(run_every=2)
+def show_jobs(study_guide):
+    """Poll the background jobs of a guide, rerunning the whole app when one of them finishes."""
+    jobs = get_job_queue().jobs(guide=study_guide, limit=5)
+    active = {job['id'] for job in jobs if job['status'] in ('queued', 'running')}
+    finished = st.session_state.get("watched_jobs", set()) - active
+    st.session_state["watched_jobs"] = active
+    for job in jobs:
+        st.caption(f"{JOB_LABELS.get(job['kind'], job['kind'])}: {job['status']}")
+        if job['status'] == 'running':
+            for stage, (done, total) in job['progress'].items():
+                st.progress(done / total if total else 1.0,
+                            text=f"{MATERIAL_STAGES.get(stage, stage)} ({done}/{total})")
+        if job['status'] == 'failed' and job['error']:
+            st.error(job['error'])
+        if job['id'] in active and st.button("Cancel", key=f"cancel-job-{job['id']}"):
+            get_job_queue().cancel(job['id'])
+    if finished:
+        # Pick up the new OCR text or materials
+        st.rerun(scope="app")
+
 
 async def main():
 
@@ -40,6 +90,8 @@ async def main():
 
     # Ensure the study_guides directory exists
     os.makedirs("study_guides", exist_ok=True)
+    # Listings and text are cached across reruns and only reread when files change
+    catalog = get_study_guide_catalog()
 
     # Parent-level navigation
     st.sidebar.title("Manage Study Guides")
@@ -59,7 +111,7 @@ async def main():
                 st.sidebar.error("Please enter a name for the new study guide.")
 
     elif study_guide_action_sel == StudyGuideAction.DELETE_STUDY_GUIDE:
-        study_guides = [d for d in os.listdir("study_guides") if os.path.isdir(os.path.join("study_guides", d))]
+        study_guides = catalog.guides()
         study_guide_to_delete = st.sidebar.selectbox("Select Study Guide to Delete", study_guides)
         if st.sidebar.button("Delete"):
             if study_guide_to_delete:
@@ -75,7 +127,7 @@ async def main():
                 st.sidebar.error("Please select a study guide to delete.")
 
     elif study_guide_action_sel == StudyGuideAction.SELECT_STUDY_GUIDE:
-        study_guides = [d for d in os.listdir("study_guides") if os.path.isdir(os.path.join("study_guides", d))]
+        study_guides = catalog.guides()
         selected_study_guide = st.sidebar.selectbox("Select Study Guide", study_guides)
         if selected_study_guide:
             st.session_state["selected_study_guide"] = selected_study_guide
@@ -85,45 +137,50 @@ async def main():
         selected_study_guide = st.session_state["selected_study_guide"]
         st.sidebar.subheader(f"Contents of '{selected_study_guide}'")
         study_guide_dir = os.path.join("study_guides", selected_study_guide)
-        extracted_texts = []
-        image_files = []
-        for file in os.listdir(study_guide_dir):
-            if file.endswith(".txt"):
-                with open(os.path.join(study_guide_dir, file), "r") as f:
-                    text = f.read()
-                    extracted_texts.append(text)
-            elif file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                image_files.append(file)
+        listing = catalog.guide(selected_study_guide)
+        image_files = listing.images
 
         # Display images as thumbnails
         if image_files:
             st.sidebar.subheader("Images")
-            for image_file in image_files:
-                image_path = os.path.join(study_guide_dir, image_file)
-                image = Image.open(image_path)
-                st.sidebar.image(image, caption=image_file, use_container_width=False, width=100)
-
-        # Check if materials.json exists and display a message
-        materials_file_path = os.path.join(study_guide_dir, 'materials.json')
-        if os.path.exists(materials_file_path):
+            shown = image_files[:SIDEBAR_THUMBNAILS]
+            for image_file, thumbnail in zip(shown, get_thumbnail_cache(study_guide_dir).thumbnails(shown)):
+                st.sidebar.image(thumbnail, caption=image_file, use_container_width=False, width=100)
+            if len(image_files) > len(shown):
+                st.sidebar.caption(f"and {len(image_files) - len(shown)} more in the gallery")
+
+        # Check if materials exist and display a message; materials.json is migrated to materials.sqlite on load
+        if listing.has_file('materials.sqlite') or listing.has_file('materials.json'):
             st.sidebar.info("Existing study materials found.")
 
         if st.sidebar.button("Generate Study Materials"):
-            generator = MaterialGenerator(output_file=materials_file_path)
-            materials = generator.generate_materials(extracted_texts)
-            st.sidebar.success("Study materials generated.")
+            # Runs in the background, so it survives reruns and does not block this session
+            get_job_queue().submit('materials', selected_study_guide)
+            st.sidebar.info("Study material generation queued.")
+
+        # Fragments cannot write into the sidebar from inside, so the sidebar holds the fragment
+        with st.sidebar:
+            show_jobs(selected_study_guide)
 
         if st.sidebar.button("Start Study Session") or "in_chat_session" in st.session_state:
-            generator = MaterialGenerator(output_file=materials_file_path)
+            generator = MaterialGenerator(output_file=os.path.join(study_guide_dir, 'materials.json'))
             materials = generator.load_materials()
             if materials:
                 st.subheader("Study Session")
+                with st.expander("Study Materials"):
+                    # Only the visible page of each section is formatted
+                    MaterialsView(materials).render(st)
                 # Set a flag to remember we're in a chat session
                 st.session_state.in_chat_session = True
                 
                 # Check if chat_session exists in session_state
                 if 'chat_session' not in st.session_state:
-                    st.session_state.chat_session = ChatSession(materials['summaries'], "orca-mini")
+                    st.session_state.chat_session = ChatSession(
+                        materials['summaries'], "orca-mini", source_texts=listing.texts(),
+                        retrieval_mode=os.environ.get('RETRIEVAL_MODE', 'tfidf'),
+                        embeddings_path=os.path.join(study_guide_dir, 'embeddings'),
+                        tfidf_path=os.path.join(study_guide_dir, 'tfidf'),
+                        guide=selected_study_guide)
                 
                 # Always call start_chat on reruns as long as we're in a chat session
                 await st.session_state.chat_session.start_chat()
@@ -132,8 +189,6 @@ async def main():
 
     # Create or select a study guide
     if "selected_study_guide" in st.session_state:
-        extracted_texts = []
-        image_files = []
         uploaded_files = None
         study_guide = st.session_state["selected_study_guide"]
         st.header(f"Study Guide: {study_guide}")
@@ -149,38 +204,34 @@ async def main():
 
         if uploaded_files:
             for uploaded_file in uploaded_files:
-                with open(os.path.join(study_guide_dir, uploaded_file.name), "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-                    image_path = f.name
+                save_upload(study_guide_dir, uploaded_file)
 
         # Load existing artifacts
-        for file in os.listdir(study_guide_dir):
-            if file.endswith(".txt"):
-                with open(os.path.join(study_guide_dir, file), "r") as f:
-                    text = f.read()
-                    extracted_texts.append(text)
-            elif file.lower().endswith(('.png', '.jpg', '.jpeg', '.pdf')):
-                image_files.append(file)
+        image_files = catalog.guide(study_guide).images
 
         if st.button("Run OCR"):
-            ocr_processor = OCRProcessor()
-            extracted_texts = await ocr_processor.process_study_guide(study_guide)
-            st.success("OCR processing complete.")
+            get_job_queue().submit('ocr', study_guide)
+            st.success("OCR processing queued; progress is shown in the sidebar.")
 
         # Display thumbnails of images in the page below the study guide title
         st.subheader("Images in Study Guide")
+        pages = max(1, -(-len(image_files) // GALLERY_PAGE_SIZE))
+        page = 1
+        if pages > 1:
+            page = st.number_input("Gallery page", min_value=1, max_value=pages, value=1, step=1)
+        visible = image_files[(page - 1) * GALLERY_PAGE_SIZE:page * GALLERY_PAGE_SIZE]
         cols = st.columns(4)  # Create 4 columns for displaying images
-        for idx, image_file in enumerate(image_files):
-            if image_file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                image_path = os.path.join(study_guide_dir, image_file)
-                image = Image.open(image_path)
-                with cols[idx % 4]:  # Cycle through columns
-                    st.image(image, caption=image_file, use_container_width=True)
+        thumbnails = get_thumbnail_cache(study_guide_dir).thumbnails(visible)
+        for idx, (image_file, thumbnail) in enumerate(zip(visible, thumbnails)):
+            with cols[idx % 4]:  # Cycle through columns
+                st.image(thumbnail, caption=image_file, use_container_width=True)
 
         # Display log messages
         st.subheader("Event Log")
         if 'log_messages' in st.session_state:
             st.text_area("Logs", value="\n".join(st.session_state['log_messages']), height=200)
+        with st.expander("Ollama request metrics"):
+            st.json(get_ollama_client().metrics.snapshot())
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+def cache_key(kind, model_id, params, text):
+    """Hash the text together with everything that changes what a model would produce for it."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([kind, model_id, params], sort_keys=True).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class MaterialCache:
+    """Persistent, size-bounded cache of generated materials keyed by content hash."""
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.logger = logging.getLogger(f"streamlit_logger.{__name__}")
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS entries ("
+                         "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    @contextmanager
+    def _connect(self):
+        # Stages run on worker threads, so each call opens its own connection
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, keys):
+        """Return a dict of the cached values for whichever keys are present."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock, self._connect() as conn:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(f"SELECT key, value FROM entries WHERE key IN ({placeholders})", batch)
+                for key, value in rows:
+                    found[key] = json.loads(value)
+                if batch:
+                    conn.execute(f"UPDATE entries SET accessed = ? WHERE key IN ({placeholders})", [time.time(), *batch])
+        return found
+
+    def put_many(self, items):
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, value in items.items():
+            encoded = json.dumps(value)
+            rows.append((key, encoded, len(encoded), now))
+        with self._lock, self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO entries (key, value, size, accessed) VALUES (?, ?, ?, ?)", rows)
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        # Drop least recently used entries until the cache fits again
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self.logger.info("Evicted %d cached material entries", evicted)
@@ -1,23 +1,98 @@
-from sentence_transformers import SentenceTransformer
-from transformers import pipeline, BartTokenizer, BartForConditionalGeneration
-from collections import Counter
-import json
+from concurrent.futures import ThreadPoolExecutor, wait
 import os
+import queue
+import threading
 from streamlit_logger import get_logger
+from model_registry import get_model_registry, SUMMARIZATION_MODEL, QUESTION_GENERATION_MODEL
+from materials_cache import MaterialCache
+from summarization import HierarchicalSummarizer
+from question_generation import QuestionGenerator
+from vocabulary import build_vocabulary, background_from_guides, combine_backgrounds, english_background
+from materials_view import materials_text
+from materials_store import MaterialsStore
+
+
+class _Stopped(BaseException):
+    # Not an Exception, so the per-batch error handling in the model stages does not swallow it
+    pass
+
 
 class MaterialGenerator:
-    def __init__(self, output_file='materials.json'):
+    def __init__(self, output_file='materials.json', registry=None, summary_batch_size=8, chunk_overlap=64,
+                 question_batch_size=4, decoding_strategy='beam', question_time_budget=None, cache_max_mb=256,
+                 vocab_top_n=500, sibling_background=None):
         self.logger = get_logger("streamlit-logger")
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.summarizer = pipeline("summarization", model="sshleifer/distilbart-cnn-12-6")
-        self.qg_tokenizer = BartTokenizer.from_pretrained("facebook/bart-large")
-        self.qg_model = BartForConditionalGeneration.from_pretrained("facebook/bart-large")
+        # Models are shared across sessions and only loaded when a method needs them
+        self.registry = registry or get_model_registry()
         self.output_file = output_file
+        self.summary_batch_size = summary_batch_size
+        self.chunk_overlap = chunk_overlap
+        self.question_batch_size = question_batch_size
+        self.decoding_strategy = decoding_strategy
+        # Seconds of decoding allowed per document, unlimited when None
+        self.question_time_budget = question_time_budget
+        self.cache_max_mb = cache_max_mb
+        self.vocab_top_n = vocab_top_n
+        if sibling_background is None:
+            sibling_background = os.environ.get('VOCAB_SIBLING_BACKGROUND', '0') == '1'
+        # Also rank vocabulary against the other study guides, not just general English
+        self.sibling_background = sibling_background
+        self._cache = None
+
+    @property
+    def model(self):
+        return self.registry.get('embedder')
+
+    @property
+    def summarizer(self):
+        return self.registry.get('summarizer')
+
+    @property
+    def qg_tokenizer(self):
+        return self.registry.get('qg_tokenizer')
+
+    @property
+    def qg_model(self):
+        return self.registry.get('qg_model')
+
+    def generate_materials(self, extracted_texts, progress_callback=None):
+        """Generate all study materials, running the model stages concurrently.
+
+        progress_callback(stage, done, total) is always called from the calling
+        thread, so it can safely update Streamlit elements.
+        """
+        events = queue.Queue()
+        # Open the cache up front so both workers share one instance
+        self.material_cache()
+
+        # Set when the caller gives up (e.g. its progress callback raised), so the workers stop at their next batch
+        stop = threading.Event()
 
-    def generate_materials(self, extracted_texts):
-        summaries = self.generate_summary(extracted_texts)
-        vocab_list = self.create_vocabulary_list(extracted_texts)
-        practice_questions = self.generate_practice_questions(extracted_texts)
+        def reporter(stage):
+            def report(done, total):
+                if stop.is_set():
+                    raise _Stopped()
+                events.put((stage, done, total))
+            return report
+
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="materials") as executor:
+            summary_future = executor.submit(self.generate_summary, extracted_texts, reporter('summaries'))
+            question_future = executor.submit(self.generate_practice_questions, extracted_texts,
+                                              reporter('practice_questions'))
+            try:
+                # Vocabulary is cheap, so it runs here while the models work
+                vocab_list = self.create_vocabulary_list(extracted_texts)
+                events.put(('vocab_list', 1, 1))
+                pending = {summary_future, question_future}
+                while pending:
+                    _, pending = wait(pending, timeout=0.25)
+                    self._drain_progress(events, progress_callback)
+                self._drain_progress(events, progress_callback)
+            except BaseException:
+                stop.set()
+                raise
+            summaries = summary_future.result()
+            practice_questions = question_future.result()
         materials = {
             'summaries': summaries,
             'vocab_list': vocab_list,
@@ -26,69 +101,61 @@ class MaterialGenerator:
         self.save_materials(materials)
         return materials
 
-    def generate_summary(self, texts):
-        summaries = []
-        for text in texts:
+    def _drain_progress(self, events, progress_callback):
+        while True:
             try:
-                # Adjust max_length based on the input length
-                input_length = len(text.split())
-                max_length = min(130, input_length)
-                summary = self.summarizer(text, max_length=max_length, min_length=30, do_sample=False)
-                if summary and len(summary) > 0:
-                    self.logger.info("Generated summary for text")
-                    summaries.append(summary[0]['summary_text'])
-                else:
-                    self.logger.warning("Summarizer returned an empty result")
-                    summaries.append("Summary not available.")
-            except Exception as e:
-                self.logger.error("Error generating summary: %s", e)
-                summaries.append("Summary not available.")
-        return summaries
+                stage, done, total = events.get_nowait()
+            except queue.Empty:
+                return
+            if progress_callback:
+                progress_callback(stage, done, total)
+
+    def material_cache(self):
+        """Return the per-guide cache of generated summaries and questions."""
+        if self._cache is None:
+            cache_path = os.path.join(os.path.dirname(self.output_file), '.cache', 'materials-cache.sqlite')
+            self._cache = MaterialCache(cache_path, max_bytes=self.cache_max_mb * 1024 * 1024)
+        return self._cache
+
+    def generate_summary(self, texts, on_progress=None):
+        # Proxies only load a model on a cache miss, so unchanged guides never touch one
+        summarizer = HierarchicalSummarizer(self.registry.proxy('summarizer'), batch_size=self.summary_batch_size,
+                                            overlap_tokens=self.chunk_overlap, logger=self.logger,
+                                            on_progress=on_progress, tokenizer=self.registry.get('summary_tokenizer'),
+                                            cache=self.material_cache(), model_id=SUMMARIZATION_MODEL)
+        return summarizer.summarize(texts)
 
     def create_vocabulary_list(self, texts):
-        words = ' '.join(texts).split()
-        vocab_counter = Counter(words)
-        vocab_list = [(word, count) for word, count in vocab_counter.most_common()]
-        self.logger.info("Generated vocabulary list")
+        # General English is the background that makes this guide's terms stand out
+        background = english_background()
+        if self.sibling_background:
+            guide_dir = os.path.dirname(os.path.abspath(self.output_file))
+            background = combine_backgrounds(background, background_from_guides(
+                os.path.dirname(guide_dir), exclude=os.path.basename(guide_dir), logger=self.logger))
+        vocab_list = build_vocabulary(texts, top_n=self.vocab_top_n, background=background)
+        self.logger.info("Generated vocabulary list of %d words", len(vocab_list))
         return vocab_list
 
-    def generate_practice_questions(self, texts):
-        questions = []
-        for text in texts:
-            try:
-                inputs = self.qg_tokenizer.encode("generate questions: " + text, return_tensors="pt", max_length=512, truncation=True)
-                outputs = self.qg_model.generate(inputs, max_length=150, num_return_sequences=5, num_beams=5)
-                for output in outputs:
-                    question = self.qg_tokenizer.decode(output, skip_special_tokens=True)
-                    questions.append(question)
-                self.logger.info("Generated practice questions for text")
-            except Exception as e:
-                self.logger.error("Error generating practice questions: %s", e)
-                questions.append("Could not generate questions.")
-        return questions
+    def generate_practice_questions(self, texts, on_progress=None):
+        generator = QuestionGenerator(self.qg_tokenizer, self.registry.proxy('qg_model'),
+                                      batch_size=self.question_batch_size, strategy=self.decoding_strategy,
+                                      time_budget=self.question_time_budget, logger=self.logger,
+                                      on_progress=on_progress, cache=self.material_cache(),
+                                      model_id=QUESTION_GENERATION_MODEL)
+        return generator.generate(texts)
+
+    def materials_store(self):
+        """Return the indexed store that holds this guide's materials, migrating materials.json if present."""
+        return MaterialsStore.for_output_file(self.output_file)
 
     def save_materials(self, materials):
-        with open(self.output_file, 'w') as file:
-            json.dump(materials, file)
-            self.logger.info("Materials saved to %s", self.output_file)
+        self.materials_store().save(materials)
 
     def load_materials(self):
-        if os.path.exists(self.output_file):
-            with open(self.output_file, 'r') as file:
-                return json.load(file)
-        return {}
+        if not (os.path.exists(os.path.splitext(self.output_file)[0] + ".sqlite") or os.path.exists(self.output_file)):
+            return {}
+        # Sections are read lazily, so opening a guide does not parse all of its materials
+        return self.materials_store().load()
 
     def format_materials(self, materials):
-        formatted_output = "Summaries:\n"
-        for summary in materials['summaries']:
-            formatted_output += f"- {summary}\n"
-
-        formatted_output += "\nVocabulary List:\n"
-        for word, count in materials['vocab_list']:
-            formatted_output += f"{word}: {count}\n"
-
-        formatted_output += "\nPractice Questions:\n"
-        for question in materials['practice_questions']:
-            formatted_output += f"- {question}\n"
-
-        return formatted_output
+        return materials_text(materials)
@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+import sqlite3
+from collections.abc import Mapping, Sequence
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+SECTION_NAMES = ('summaries', 'vocab_list', 'practice_questions')
+
+
+class MaterialsStore:
+    """Per-guide SQLite store of study materials, one row per item.
+
+    Every write is a single transaction, so a crash never leaves a half-written
+    guide. Reads are lazy: load() returns sections that fetch only the items that
+    are actually indexed or iterated. An existing materials.json next to the store
+    is migrated on first use and kept as materials.json.bak. A readonly store opens
+    an existing file as is, without creating or migrating anything.
+    """
+
+    def __init__(self, path, legacy_path=None, readonly=False):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.readonly = readonly
+        self.logger = logging.getLogger(f"streamlit_logger.{__name__}")
+        if readonly:
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS items ("
+                         "section TEXT NOT NULL, position INTEGER NOT NULL, value TEXT NOT NULL, "
+                         "PRIMARY KEY (section, position))")
+        self._migrate()
+
+    @classmethod
+    def for_output_file(cls, output_file):
+        """Return the store that replaces the given materials.json path."""
+        return cls(os.path.splitext(output_file)[0] + ".sqlite", legacy_path=output_file)
+
+    def exists(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM items LIMIT 1").fetchone() is not None
+
+    def save(self, materials):
+        """Replace every section with the given materials in one transaction."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM items")
+            for section, items in materials.items():
+                self._insert(conn, section, items, 0)
+        self.logger.info("Materials saved to %s", self.path)
+
+    def append(self, section, items):
+        """Add items to the end of a section in one transaction."""
+        with self._connect() as conn:
+            start = conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM items WHERE section = ?",
+                                 (section,)).fetchone()[0]
+            self._insert(conn, section, items, start)
+
+    def load(self):
+        """Return the materials as a read-only mapping of lazily read sections, or {} if there are none."""
+        if not self.exists():
+            return {}
+        return LazyMaterials(self)
+
+    def section(self, name):
+        return LazySection(self, name)
+
+    def count(self, section):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM items WHERE section = ?", (section,)).fetchone()[0]
+
+    def read(self, section, start, stop):
+        """Return the items of a section with positions in [start, stop)."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT value FROM items WHERE section = ? AND position >= ? AND position < ? "
+                                "ORDER BY position", (section, start, stop))
+            return [json.loads(value) for value, in rows]
+
+    def sections(self):
+        with self._connect() as conn:
+            present = {row[0] for row in conn.execute("SELECT DISTINCT section FROM items")}
+        # Known sections keep their usual order, anything else follows
+        return [name for name in SECTION_NAMES if name in present] + sorted(present - set(SECTION_NAMES))
+
+    def _insert(self, conn, section, items, start):
+        conn.executemany("INSERT INTO items (section, position, value) VALUES (?, ?, ?)",
+                         ((section, start + offset, json.dumps(item)) for offset, item in enumerate(items)))
+
+    def _migrate(self):
+        if not self.legacy_path or not os.path.exists(self.legacy_path) or self.exists():
+            return
+        try:
+            with open(self.legacy_path, 'r') as file:
+                materials = json.load(file)
+        except (OSError, ValueError) as e:
+            self.logger.error("Could not migrate %s: %s", self.legacy_path, e)
+            return
+        self.save(materials)
+        # Keep the original around, but out of the way so it is not mistaken for current materials
+        os.replace(self.legacy_path, f"{self.legacy_path}.bak")
+        self.logger.info("Migrated %s to %s", self.legacy_path, self.path)
+
+    @contextmanager
+    def _connect(self):
+        if self.readonly:
+            conn = sqlite3.connect(f"file:{pathname2url(os.path.abspath(self.path))}?mode=ro", uri=True, timeout=30)
+        else:
+            conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+
+class LazySection(Sequence):
+    """Read-only sequence over one section of a MaterialsStore; indexing and slicing query only those items."""
+
+    def __init__(self, store, name, batch_size=500):
+        self.store = store
+        self.name = name
+        self.batch_size = batch_size
+        self._length = None
+
+    def __len__(self):
+        if self._length is None:
+            self._length = self.store.count(self.name)
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            items = self.store.read(self.name, start, stop) if start < stop else []
+            return items[::step] if step != 1 else items
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("section index out of range")
+        return self.store.read(self.name, index, index + 1)[0]
+
+    def __iter__(self):
+        # Read in batches instead of one query per item or the whole section at once
+        for start in range(0, len(self), self.batch_size):
+            yield from self.store.read(self.name, start, start + self.batch_size)
+
+
+class LazyMaterials(Mapping):
+    """The materials of a guide as a mapping of section name to LazySection."""
+
+    def __init__(self, store):
+        self.store = store
+        # The usual sections are always there, even when empty, like in materials.json
+        names = list(SECTION_NAMES) + [name for name in store.sections() if name not in SECTION_NAMES]
+        self._sections = {name: store.section(name) for name in names}
+
+    def __getitem__(self, name):
+        return self._sections[name]
+
+    def __iter__(self):
+        return iter(self._sections)
+
+    def __len__(self):
+        return len(self._sections)
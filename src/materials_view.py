@@ -0,0 +1,76 @@
+import io
+from itertools import islice
+
+# materials.json section, heading
+SECTIONS = (
+    ('summaries', "Summaries"),
+    ('vocab_list', "Vocabulary List"),
+    ('practice_questions', "Practice Questions"),
+)
+
+
+def format_item(section, item):
+    if section == 'vocab_list':
+        word, count = item
+        return f"{word}: {count}"
+    return f"- {item}"
+
+def iter_section_lines(materials, section, start=0, stop=None):
+    """Yield the formatted lines of one section, from item start up to stop."""
+    items = materials.get(section) or []
+    # Slicing jumps straight to the page; islice would walk every earlier item
+    selected = items[start:stop] if hasattr(items, "__getitem__") else islice(items, start, stop)
+    for item in selected:
+        yield format_item(section, item)
+
+def write_materials(materials, out):
+    """Write all materials as plain text to a file-like object, one line at a time."""
+    for number, (section, heading) in enumerate(SECTIONS):
+        out.write(f"{heading}:\n" if number == 0 else f"\n{heading}:\n")
+        for line in iter_section_lines(materials, section):
+            out.write(line)
+            out.write("\n")
+
+def materials_text(materials):
+    buffer = io.StringIO()
+    write_materials(materials, buffer)
+    return buffer.getvalue()
+
+
+class MaterialsView:
+    """Renders study materials a page at a time, one tab per section.
+
+    Each rerun only formats the items on the visible pages, so rendering cost does
+    not depend on the size of the guide. Sections only need len() and slicing.
+    """
+
+    def __init__(self, materials, page_size=20, key="materials"):
+        self.materials = materials
+        self.page_size = page_size
+        self.key = key
+
+    def page_count(self, section):
+        return max(1, -(-len(self.materials.get(section) or []) // self.page_size))
+
+    def page(self, section, number):
+        start = (number - 1) * self.page_size
+        return list(iter_section_lines(self.materials, section, start, start + self.page_size))
+
+    def render(self, st):
+        tabs = st.tabs([heading for _, heading in SECTIONS])
+        for tab, (section, heading) in zip(tabs, SECTIONS):
+            with tab:
+                self.render_section(st, section, heading)
+
+    def render_section(self, st, section, heading):
+        items = self.materials.get(section) or []
+        if not len(items):
+            st.caption(f"No {heading.lower()} yet.")
+            return
+        pages = self.page_count(section)
+        number = 1
+        if pages > 1:
+            number = st.number_input(f"{heading} page", min_value=1, max_value=pages, value=1, step=1,
+                                     key=f"{self.key}-{section}-page")
+        st.caption(f"{len(items)} items, page {number} of {pages}")
+        st.text("\n".join(self.page(section, number)))
@@ -0,0 +1,216 @@
+import functools
+import gc
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+SUMMARIZATION_MODEL = "sshleifer/distilbart-cnn-12-6"
+QUESTION_GENERATION_MODEL = "facebook/bart-large"
+
+
+def _load_embedder():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL)
+
+def _load_summary_tokenizer():
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(SUMMARIZATION_MODEL)
+
+def _load_summarizer():
+    from transformers import pipeline
+    return pipeline("summarization", model=SUMMARIZATION_MODEL)
+
+def _load_qg_tokenizer():
+    from transformers import BartTokenizer
+    return BartTokenizer.from_pretrained(QUESTION_GENERATION_MODEL)
+
+def _load_qg_model():
+    from transformers import BartForConditionalGeneration
+    return BartForConditionalGeneration.from_pretrained(QUESTION_GENERATION_MODEL)
+
+
+def _estimate_size(obj):
+    """Estimate the resident size of a model in bytes from its parameters and buffers."""
+    # Pipelines wrap the torch module in a `model` attribute
+    module = getattr(obj, "model", obj)
+    if not callable(getattr(module, "parameters", None)):
+        return 0
+    size = sum(p.numel() * p.element_size() for p in module.parameters())
+    if callable(getattr(module, "buffers", None)):
+        size += sum(b.numel() * b.element_size() for b in module.buffers())
+    return size
+
+
+class _Entry:
+    def __init__(self, obj, size):
+        self.obj = obj
+        self.size = size
+        self.leases = 0
+        self.last_used = time.monotonic()
+
+
+class ModelProxy:
+    """Stand-in for a registered model that is only loaded when it is actually used."""
+
+    def __init__(self, registry, name):
+        self._registry = registry
+        self._name = name
+
+    def __call__(self, *args, **kwargs):
+        with self._registry.lease(self._name) as (model,):
+            return model(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        value = getattr(self._registry.get(self._name), attr)
+        if not callable(value):
+            return value
+
+        @functools.wraps(value)
+        def leased(*args, **kwargs):
+            # Methods such as generate() and encode() keep the model pinned until they return
+            with self._registry.lease(self._name) as (model,):
+                return getattr(model, attr)(*args, **kwargs)
+        return leased
+
+
+class ModelRegistry:
+    """Process-wide, lazily loaded model cache with an LRU memory budget."""
+
+    def __init__(self, memory_budget_mb=None):
+        if memory_budget_mb is None:
+            memory_budget_mb = float(os.environ.get('MODEL_MEMORY_BUDGET_MB', 0))
+        # A budget of 0 means unlimited
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.logger = logging.getLogger(f"streamlit_logger.{__name__}")
+        self._loaders = {}
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._load_locks = {}
+
+    def register(self, name, loader):
+        with self._lock:
+            self._loaders[name] = loader
+            self._load_locks.setdefault(name, threading.Lock())
+
+    def is_loaded(self, name):
+        with self._lock:
+            return name in self._entries
+
+    def memory_usage(self):
+        with self._lock:
+            return sum(entry.size for entry in self._entries.values())
+
+    def get(self, name):
+        """Return the named model, loading it on first use."""
+        with self._lock:
+            entry = self._touch(name)
+            if entry is not None:
+                return entry.obj
+            if name not in self._loaders:
+                raise KeyError(f"No model registered under '{name}'")
+            load_lock = self._load_locks[name]
+
+        # Load outside the registry lock so other models stay available,
+        # but only once per name even if several sessions ask at the same time
+        with load_lock:
+            with self._lock:
+                entry = self._touch(name)
+                if entry is not None:
+                    return entry.obj
+            started = time.monotonic()
+            obj = self._loaders[name]()
+            size = _estimate_size(obj)
+            self.logger.info("Loaded model %s (%.1f MB) in %.1fs", name, size / (1024 * 1024), time.monotonic() - started)
+            with self._lock:
+                self._entries[name] = _Entry(obj, size)
+                self._enforce_budget(keep=name)
+            return obj
+
+    @contextmanager
+    def lease(self, *names):
+        """Pin models for the duration of a block so they cannot be evicted while in use."""
+        leased = []
+        models = []
+        try:
+            for name in names:
+                # Retry if another session evicted the model between loading and pinning
+                while True:
+                    obj = self.get(name)
+                    with self._lock:
+                        entry = self._entries.get(name)
+                        if entry is not None and entry.obj is obj:
+                            entry.leases += 1
+                            leased.append(name)
+                            models.append(obj)
+                            break
+            yield tuple(models)
+        finally:
+            with self._lock:
+                released = False
+                for name in leased:
+                    entry = self._entries.get(name)
+                    if entry is not None:
+                        entry.leases -= 1
+                        entry.last_used = time.monotonic()
+                        self._entries.move_to_end(name)
+                        released = released or entry.leases == 0
+                if released:
+                    # A load that went over budget while models were leased could not evict them then
+                    self._enforce_budget(keep=None)
+
+    def proxy(self, name):
+        if name not in self._loaders:
+            raise KeyError(f"No model registered under '{name}'")
+        return ModelProxy(self, name)
+
+    def evict(self, name):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry.leases > 0:
+                return False
+            del self._entries[name]
+        self.logger.info("Evicted model %s (%.1f MB)", name, entry.size / (1024 * 1024))
+        del entry
+        gc.collect()
+        return True
+
+    def _touch(self, name):
+        entry = self._entries.get(name)
+        if entry is not None:
+            entry.last_used = time.monotonic()
+            self._entries.move_to_end(name)
+        return entry
+
+    def _enforce_budget(self, keep):
+        if not self.memory_budget:
+            return
+        # Least recently used models come first in the ordered dict
+        for name in list(self._entries):
+            if self.memory_usage() <= self.memory_budget:
+                return
+            if name != keep and self._entries[name].leases == 0:
+                self.evict(name)
+        if self.memory_usage() > self.memory_budget:
+            self.logger.warning("Model memory usage %.1f MB exceeds budget of %.1f MB",
+                                self.memory_usage() / (1024 * 1024), self.memory_budget / (1024 * 1024))
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_model_registry():
+    """Return the registry shared by every session in this process."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry()
+            _registry.register('embedder', _load_embedder)
+            _registry.register('summary_tokenizer', _load_summary_tokenizer)
+            _registry.register('summarizer', _load_summarizer)
+            _registry.register('qg_tokenizer', _load_qg_tokenizer)
+            _registry.register('qg_model', _load_qg_model)
+        return _registry
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import time
+
+MANIFEST_VERSION = 2
+
+
+def hash_file(file_path, block_size=1024 * 1024):
+    """Return the SHA-256 of a file, read in blocks so large scans stay cheap on memory."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class OCRManifest:
+    """Content-addressed record of which study guide files have already been OCR'd.
+
+    `files` maps a path to the size, mtime and hash last seen for it, so unchanged
+    files are recognised from a stat call alone. `entries` maps a content hash to
+    how and where its text was extracted, so the same page under two names is only
+    processed once and an edited file is processed again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        self.entries = {}
+        self._legacy = set()
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                self._load(json.load(file))
+
+    def _load(self, contents):
+        if contents.get("version") == MANIFEST_VERSION:
+            self.files = contents.get("files", {})
+            self.entries = contents.get("entries", {})
+        else:
+            # Old manifests were a flat {path: True} map with no record of content
+            self._legacy = {path for path, processed in contents.items() if processed}
+
+    def content_hash(self, file_path):
+        """Return the file's content hash, hashing only if its size or mtime changed."""
+        stat = os.stat(file_path)
+        record = self.files.get(file_path)
+        if record and record["size"] == stat.st_size and record["mtime"] == stat.st_mtime_ns:
+            return record["hash"]
+        content_hash = hash_file(file_path)
+        self.files[file_path] = {"hash": content_hash, "size": stat.st_size, "mtime": stat.st_mtime_ns}
+        return content_hash
+
+    def is_processed(self, file_path, content_hash):
+        if content_hash in self.entries:
+            entry = self.entries[content_hash]
+            if file_path not in entry["sources"]:
+                entry["sources"].append(file_path)
+            return True
+        if file_path in self._legacy:
+            # Trust the old manifest for files it already covered instead of re-running OCR
+            self.record(file_path, content_hash, extractor="legacy", duration=0.0, output=None)
+            return True
+        return False
+
+    def forget(self, file_path, content_hash):
+        """Remove a file from the sources of content it no longer has; the entry goes once no source is left."""
+        entry = self.entries.get(content_hash)
+        if entry is None:
+            return
+        if file_path in entry["sources"]:
+            entry["sources"].remove(file_path)
+        if not entry["sources"]:
+            # A file reverted to this content later must be processed again
+            del self.entries[content_hash]
+
+    def remove(self, file_path):
+        """Forget a file that no longer exists."""
+        record = self.files.pop(file_path, None)
+        if record:
+            self.forget(file_path, record["hash"])
+
+    def record(self, file_path, content_hash, extractor, duration, output):
+        stat = self.files.get(file_path, {})
+        self.entries[content_hash] = {
+            "sources": [file_path],
+            "size": stat.get("size"),
+            "mtime": stat.get("mtime"),
+            "extractor": extractor,
+            "duration": round(duration, 3),
+            "output": output,
+            "processed_at": time.time(),
+        }
+
+    def to_dict(self):
+        return {"version": MANIFEST_VERSION, "files": self.files, "entries": self.entries}
+
+    def save(self):
+        # Write to a temporary file first so a crash never leaves a half-written manifest
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(self.to_dict(), file)
+        os.replace(temp_path, self.path)
@@ -1,104 +1,236 @@
-import streamlit as st
 import base64
-import aiohttp
-from PIL import Image
 import os
-import json
-from sentence_transformers import SentenceTransformer
-from transformers import pipeline, T5Tokenizer, T5ForConditionalGeneration
-from collections import Counter
-from sklearn.feature_extraction.text import TfidfVectorizer
 import asyncio
+import functools
 import nest_asyncio
-import PyPDF2
+import time
 from streamlit_logger import get_logger
+from ocr_manifest import OCRManifest
+from ocr_scheduler import OCRScheduler, OCRRequestError
+from ocr_store import OCRPageStore
+from pdf_extractor import PDFExtractor, rasterization_available
+from ollama_client import get_ollama_client, OllamaError
+from image_preprocessor import ImagePreprocessor
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.gif')
+VISION_MODEL = "llama3.2-vision"
+
+# Worth retrying: rate limiting and a server that is still loading the model
+RETRYABLE_STATUSES = (408, 429, 502, 503, 504)
 
 class OCRProcessor:
-    def __init__(self):
-        self.logger = get_logger()
+    def __init__(self, max_in_flight=None, group_size=1, max_retries=3, rasterize_scale=2.0, preprocessor=None,
+                 preprocess_images=True):
+        self.logger = get_logger("streamlit-logger")
+        if max_in_flight is None:
+            max_in_flight = int(os.environ.get('OCR_MAX_IN_FLIGHT', 2))
+        # Tune to how many requests the Ollama server runs in parallel
+        self.max_in_flight = max_in_flight
+        self.group_size = group_size
+        self.max_retries = max_retries
+        # Resizes, cleans up and re-encodes images before OCR; outputs are cached by content hash
+        self.preprocessor = preprocessor or (ImagePreprocessor() if preprocess_images else None)
+        # Pooled keep-alive connections shared with chat and every other Ollama caller
+        self.ollama = get_ollama_client()
+        # PDF parsing runs in a shared process pool so it never blocks the event loop
+        self.pdf_extractor = PDFExtractor()
+        # Scanned PDF pages are rendered at this scale (1.0 is 72 dpi) and sent to the vision model
+        self.rasterize_scale = rasterize_scale
+        if rasterize_scale and not rasterization_available():
+            self.logger.warning("pypdfium2 is not installed; scanned PDF pages will not be OCR'd")
+            self.rasterize_scale = None
         nest_asyncio.apply()
 
-    async def process_study_guide(self, study_guide_name):      
+    async def process_study_guide(self, study_guide_name, progress_callback=None):
+        """OCR every new or changed file of a guide; progress_callback(done, total) is called per finished file."""
         try:
             study_guide_dir = os.path.join("study_guides", study_guide_name)
 
             studyguide_manifest_name = f"manifest-{study_guide_name}.json"
             studyguide_manifest_location = os.path.join(study_guide_dir, studyguide_manifest_name)
-            studyguide_manifest_contents = {}
             extracted_text = []
             tasks = []
-            aggregate_encoded_image_tasks = []
-            base64_images_to_process = []
+            image_sources = []
+            scheduled = {}
+
+            def finish(sources, pages, duration, extractor):
+                if pages is None:
+                    # Failed extractions stay out of the manifest so the next run retries them
+                    return
+                extracted_text.extend(pages)
+                for file_path, content_hash in sources:
+                    manifest.record(file_path, content_hash, extractor, duration, store.index_path)
+                    manifest.entries[content_hash]["sources"].extend(scheduled[content_hash])
+                # Saved per group, so work finished before a crash is not repeated
+                manifest.save()
+
+            def queue(file_path, content_hash):
+                # Check if the file is an image
+                if file_path.lower().endswith(IMAGE_EXTENSIONS):
+                    # Queue the image for the OCR scheduler
+                    self.logger.info("Processing image: %s", file_path)
+                    image_sources.append((file_path, content_hash))
+                # Otherwise the file is a PDF
+                else:
+                    # Add task to process the PDF file
+                    tasks.append(self._extract_pdf([(file_path, content_hash)], store, finish))
+
+            # Files whose content changed since the last run, and every file by its current content
+            changed = []
+            current = {}
 
             # Ensure the directory exists
             if not os.path.exists(study_guide_dir):
                 os.makedirs(study_guide_dir, exist_ok=True)
 
             # Load the manifest file if it exists
-            if os.path.exists(studyguide_manifest_location):
-                with open(studyguide_manifest_location, "r") as file:
-                    studyguide_manifest_contents = json.load(file) 
+            manifest = OCRManifest(studyguide_manifest_location)
+            # Pages are written here as soon as each one is extracted
+            store = OCRPageStore.for_guide(study_guide_dir, study_guide_name)
 
-            # Display the contents of the manifest on the Streamlit screen
-            st.write("Study Guide Manifest Contents:")
-            st.json(studyguide_manifest_contents)
+            # This runs on a job worker thread, so progress goes to the log rather than the page
+            self.logger.info("Manifest for '%s' lists %d files and %d extracted contents", study_guide_name,
+                             len(manifest.files), len(manifest.entries))
             
             # Walk through the study guide directory
-            for root, _, files in os.walk(study_guide_dir):
+            for root, dirs, files in os.walk(study_guide_dir):
+                # Hidden directories hold caches, not study material
+                dirs[:] = [d for d in dirs if not d.startswith('.')]
                 # Process each file in the directory
                 for file in files:
                     file_path = os.path.join(root, file)
-                    if file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.gif', 'pdf')):
-                        st.info(f"Checking if file already processed: {file_path}")
-                        # Skip files that have already been processed
-                        if studyguide_manifest_contents.get(file_path, False):
-                            st.info(f"Skipping file: {file_path}")
-                            continue
-                    # Check if the file is an image
-                    if file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.gif')):
-                        # Add task to base64 encode the image
-                        st.info(f"Processing image: {file_path}")
-                        aggregate_encoded_image_tasks.append(self.encode_image_to_base64(file_path))
-                        # Mark the image as processed in the manifest
-                        studyguide_manifest_contents[file_path] = True
-                    # Check if the file is a PDF
-                    elif file.lower().endswith('.pdf'):
-                        # Add task to process the PDF file
-                        tasks.append(self.process_pdf(file_path))
-                        # Mark the PDF as processed in the manifest
-                        studyguide_manifest_contents[file_path] = True
+                    is_image = file.lower().endswith(IMAGE_EXTENSIONS)
+                    is_pdf = file.lower().endswith('.pdf')
+                    if not (is_image or is_pdf):
+                        continue
+                    self.logger.debug("Checking if file already processed: %s", file_path)
+                    previous_hash = manifest.files.get(file_path, {}).get("hash")
+                    # Unchanged files are recognised from their size and mtime without rehashing
+                    content_hash = manifest.content_hash(file_path)
+                    current.setdefault(content_hash, []).append(file_path)
+                    if previous_hash and previous_hash != content_hash:
+                        changed.append((file_path, previous_hash))
+                    # Skip content already processed, or already queued under another name
+                    if manifest.is_processed(file_path, content_hash) or content_hash in scheduled:
+                        scheduled.get(content_hash, []).append(file_path)
+                        self.logger.info("Skipping file: %s", file_path)
+                        continue
+                    scheduled[content_hash] = []
+                    queue(file_path, content_hash)
+            walked = {path for paths in current.values() for path in paths}
+            # Deleted files are dropped like changed ones, so their pages stop feeding materials and chat
+            deleted = [(path, record["hash"]) for path, record in manifest.files.items() if path not in walked]
+            requeue = []
+            for file_path, previous_hash in changed + deleted:
+                # Pages from the old content are dropped, unless another file still has that content
+                requeue.extend(store.invalidate(file_path, previous_hash,
+                                                replacement=next(iter(current.get(previous_hash, [])), None)))
+                manifest.forget(file_path, previous_hash)
+            for file_path, _ in deleted:
+                manifest.remove(file_path)
+            for file_path, content_hash in requeue:
+                # These files shared an OCR request with a dropped file, so their text went with it
+                manifest.entries.pop(content_hash, None)
+                if file_path in current.get(content_hash, []) and content_hash not in scheduled:
+                    scheduled[content_hash] = [path for path in current[content_hash] if path != file_path]
+                    queue(file_path, content_hash)
+            self._progress = {"done": 0, "total": len(image_sources) + len(tasks), "callback": progress_callback}
+            self._advance(0)
             # Check if there are any image processing tasks
-            if aggregate_encoded_image_tasks:
-                # Wait for all images to be base64 encoded, and gather the results as a list
-                base64_images_to_process = await asyncio.gather(*aggregate_encoded_image_tasks)
-                # Check if there are any base64 encoded images in the list to process
-                if base64_images_to_process:
-                    # Add the task to extract text from images
-                    tasks.append(self.extract_text_from_images(base64_images_to_process))
-            # Wait for all tasks to complete
-            if tasks:
-                # Gather text from image and pdf extraction tasks
-                extracted_text.extend(await asyncio.gather(*tasks))
+            if image_sources:
+                # Add the task to send the images through the OCR scheduler
+                tasks.append(self._extract_images(image_sources, store, finish))
+            # Wait for all tasks to complete; each group is recorded as soon as it finishes
+            await asyncio.gather(*tasks)
             # Save the manifest file
-            with open(studyguide_manifest_location, "w") as file:
-                json.dump(studyguide_manifest_contents, file)
-
-            # Append the extracted text to the ocr file
-            extracted_text_location = os.path.join(study_guide_dir, f"ocr-{study_guide_name}.txt")
-            with open(extracted_text_location, "a") as f:
-                f.write("\n".join(extracted_text))
+            manifest.save()
 
             return extracted_text 
         except Exception as e:
-            st.error(f"Error processing study guide: {e}")
-            return None
+            self.logger.exception("Error processing study guide %s: %s", study_guide_name, e)
+            # Re-raised so the job records the real error
+            raise
+
+    async def _extract_pdf(self, sources, store, finish):
+        started = time.monotonic()
+        file_path = sources[0][0]
+        self.logger.info("Processing PDF file: %s", file_path)
+        # Pages stored by an earlier, partly failed run are kept instead of being OCR'd again
+        stored = store.stored_pages(sources)
+        pages = [store.read_page(record) for _, record in sorted(stored.items())]
+        extractors = {record["extractor"] for record in stored.values()} | {"PyPDF2"}
+
+        async def scanned_pages():
+            # Pages with a usable text layer are stored right away; only scans go to the vision model
+            async for page in self.pdf_extractor.iter_pages(file_path, self.rasterize_scale, skip=stored):
+                if page.image is None:
+                    store.append_page(sources, page.number, page.text, "PyPDF2")
+                    pages.append(page.text)
+                else:
+                    yield page
+
+        try:
+            failed = 0
+            scheduler = self._scheduler(functools.partial(self._ocr_pdf_page_group, file_path))
+            async for group, text, _ in scheduler.stream(scanned_pages()):
+                extractors.add(VISION_MODEL)
+                if text is None:
+                    failed += len(group)
+                    continue
+                store.append_page(sources, group[0].number, text, VISION_MODEL)
+                pages.append(text)
+            if failed:
+                self.logger.error("Vision OCR failed for %d scanned pages of %s", failed, file_path)
+                pages = None
+        except Exception as e:
+            # Pages already stored stay valid, but the file is retried on the next run
+            self.logger.error("Error extracting text from PDF %s: %s", file_path, e)
+            pages = None
+        finish(sources, pages, time.monotonic() - started, "+".join(sorted(extractors)))
+        self._advance(1)
+
+    async def _extract_images(self, sources, store, finish):
+        self.logger.info("Extracting text from %d images", len(sources))
+        # Store each image's text as soon as its request completes
+        async for group, text, duration in self._scheduler(self._ocr_image_group).stream(sources):
+            if text is not None:
+                store.append_page(group, 1, text, VISION_MODEL)
+            finish(group, None if text is None else [text], duration, VISION_MODEL)
+            self._advance(len(group))
+
+    def _advance(self, files):
+        progress = getattr(self, "_progress", None)
+        if progress and progress["callback"]:
+            progress["done"] += files
+            progress["callback"](progress["done"], progress["total"])
+
+    def _scheduler(self, send):
+        return OCRScheduler(send, max_in_flight=self.max_in_flight, group_size=self.group_size,
+                            max_retries=self.max_retries, logger=self.logger)
+
+    async def _ocr_image_group(self, sources):
+        # Images are only read and encoded once the scheduler gives the group a slot
+        base64_images = await asyncio.gather(*(self.encode_image_to_base64(file_path, content_hash)
+                                               for file_path, content_hash in sources))
+        payload = await self.create_payload(list(base64_images))
+        return await self.request_text(payload)
+
+    async def _ocr_pdf_page_group(self, file_path, pages):
+        cache_dir = os.path.join(os.path.dirname(file_path), ".cache", "ocr-images")
+        base64_images = await asyncio.gather(*(self._encode_bytes(page.image, cache_dir) for page in pages))
+        payload = await self.create_payload(list(base64_images))
+        return await self.request_text(payload)
+
+    async def _encode_bytes(self, data, cache_dir):
+        if self.preprocessor is not None:
+            data = await asyncio.to_thread(self.preprocessor.process_bytes, data, cache_dir)
+        return base64.b64encode(data).decode("utf-8")
     
     async def extract_text_from_images(self, base64_images):
-        st.info("Extracting text from images...")
+        self.logger.info("Extracting text from images")
         base64_images = await self.ensure_list(base64_images)
         payload = await self.create_payload(base64_images)
-        response = await self.send_request(payload)
-        return await self.process_response(response)
+        return await self.send_request(payload)
 
     async def ensure_list(self, base64_images):
         if not isinstance(base64_images, list):
@@ -115,44 +247,43 @@ class OCRProcessor:
         5. **Output as a Block of Text**: Output the entire transcribed text as a block, maintaining the line breaks, but ensuring that each word appears as it should, with correct spelling, no character-level splits, and no hyphenations unless they appear naturally in the image."""
       
         payload = {
-            "model": "llama3.2-vision",
+            "model": VISION_MODEL,
             "messages": [
                 {
                     "role": "user",
                     "content": prompt,
                     "images": base64_images
                 }
-            ]
+            ],
+            "stream": False
         }
         return payload
 
     async def send_request(self, payload):
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post("http://localhost:11434/api/chat", 
-                    headers={"Content-Type": "application/json"}, 
-                    json=payload) as response:
-                        return await self.process_response(response)
-        except aiohttp.ClientError as e:
-            st.error(f"Error sending request to OCR tool: {e}")
+            return await self.request_text(payload)
+        except OCRRequestError as e:
+            self.logger.error("Error sending request to OCR tool: %s", e)
             return None
 
-    async def process_response(self, response):
+    async def request_text(self, payload):
+        """Send one OCR request and return its text, raising OCRRequestError on failure."""
         try:
-            if response and response.status == 200:
-                response_json = await response.json()
-                choices = response_json.get("choices", [])
-                if choices and "message" in choices[0] and "content" in choices[0]["message"]:
-                    return choices[0]["message"]["content"].strip()
-                else:
-                    return "No text found in the image."
-            else:
-                st.error(f"Error: {response.status} - {await response.text()}")
-                return None
-        except (Exception, json.JSONDecodeError) as e:
-            st.error(f"Error extracting text from images: {e}")
-            st.write("Raw Response:", await response.text())
-            return None
+            response_json = await self.ollama.post_json("/api/chat", payload)
+        except OllamaError as e:
+            retryable = e.status is None or e.status in RETRYABLE_STATUSES or e.status >= 500
+            raise OCRRequestError(str(e), retryable=retryable) from e
+        return self.process_response(response_json)
+
+    def process_response(self, response_json):
+        # Ollama's native chat API returns a single message; OpenAI-style servers return choices
+        message = response_json.get("message")
+        if not message:
+            choices = response_json.get("choices", [])
+            message = choices[0].get("message") if choices else None
+        if message and message.get("content"):
+            return message["content"].strip()
+        return "No text found in the image."
 
     async def process_pdf(self, file_path):
         self.logger.info("Processing PDF file: %s", file_path)
@@ -160,16 +291,20 @@ class OCRProcessor:
         return text
     
     async def extract_text_from_pdf(self, file_path):
-        text = ""
-        with open(file_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            for page_num in range(len(reader.pages)):
-                page = reader.pages[page_num]
-                text += page.extract_text()
-        return text
+        pages = sorted([page async for page in self.iter_pdf_pages(file_path)])
+        return "".join(text for _, text in pages)
+
+    async def iter_pdf_pages(self, file_path):
+        """Yield (page_number, text) for each page of a PDF, numbered from 1, as pages complete."""
+        async for page in self.pdf_extractor.iter_pages(file_path):
+            yield page.number, page.text
     
-    async def encode_image_to_base64(self, image_path):
-        """Convert an image file to a base64 encoded string."""
+    async def encode_image_to_base64(self, image_path, content_hash=None):
+        """Convert an image file to a base64 encoded string, pre-processed to shrink the payload."""
+        if self.preprocessor is not None:
+            # Pillow work is CPU-bound, so keep it off the event loop
+            data = await asyncio.to_thread(self.preprocessor.process_file, image_path, content_hash)
+            return base64.b64encode(data).decode("utf-8")
         with open(image_path, "rb") as image_file:
             return base64.b64encode(image_file.read()).decode("utf-8")
 
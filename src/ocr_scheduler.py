@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import random
+import time
+
+
+class OCRRequestError(Exception):
+    """Raised when an OCR request fails; retryable errors are worth sending again."""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class OCRScheduler:
+    """Send OCR work as small requests with a bounded number in flight at once."""
+
+    def __init__(self, send, max_in_flight=2, group_size=1, max_retries=3, backoff=1.0, logger=None):
+        # send(group) is a coroutine returning the text for a list of items
+        self.send = send
+        self.max_in_flight = max(1, max_in_flight)
+        self.group_size = max(1, group_size)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.logger = logger or logging.getLogger(f"streamlit_logger.{__name__}")
+
+    async def stream(self, items):
+        """Yield (group, text, duration) as each group finishes; text is None if it failed for good.
+
+        items may be a list or an async iterable. Groups are handed to a fixed pool of
+        max_in_flight workers through a bounded queue, so a slow server holds back the
+        producer instead of letting pending work pile up in memory.
+        """
+        work = asyncio.Queue(maxsize=self.max_in_flight)
+        results = asyncio.Queue()
+
+        async def produce():
+            try:
+                group = []
+                async for item in _iterate(items):
+                    group.append(item)
+                    if len(group) == self.group_size:
+                        await work.put(group)
+                        group = []
+                if group:
+                    await work.put(group)
+            finally:
+                # Always release the workers, even if the producer failed
+                for _ in range(self.max_in_flight):
+                    await work.put(None)
+
+        async def worker():
+            try:
+                while (group := await work.get()) is not None:
+                    started = time.monotonic()
+                    text = await self._send_with_retry(group)
+                    await results.put((group, text, time.monotonic() - started))
+            finally:
+                # The consumer counts these, so it must get one however the worker stops
+                results.put_nowait(None)
+
+        producer = asyncio.ensure_future(produce())
+        workers = [asyncio.ensure_future(worker()) for _ in range(self.max_in_flight)]
+        try:
+            finished = 0
+            while finished < len(workers):
+                result = await results.get()
+                if result is None:
+                    finished += 1
+                    continue
+                yield result
+            # Surface any error raised while producing the work
+            await producer
+        finally:
+            for task in [producer, *workers]:
+                task.cancel()
+
+    async def run(self, items):
+        return [result async for result in self.stream(items)]
+
+    async def _send_with_retry(self, group):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self.send(group)
+            except OCRRequestError as e:
+                if not e.retryable or attempt == self.max_retries:
+                    self.logger.error("OCR request failed after %d attempts: %s", attempt + 1, e)
+                    return None
+                # Exponential backoff with jitter so retries from parallel slots spread out
+                delay = self.backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+                self.logger.warning("OCR request failed (%s), retrying in %.1fs", e, delay)
+                await asyncio.sleep(delay)
+            except Exception as e:
+                # Anything else is not worth retrying, but must not take the worker down
+                self.logger.exception("OCR request failed: %s", e)
+                return None
+
+
+async def _iterate(items):
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
@@ -0,0 +1,142 @@
+import json
+import os
+import threading
+import time
+
+
+def index_path_for(text_path):
+    return os.path.splitext(text_path)[0] + ".pages.jsonl"
+
+
+class OCRPageStore:
+    """Append-only, page-level store of OCR output.
+
+    Page text is appended to the guide's ocr-<guide>.txt as before, and every page
+    gets a JSON line in ocr-<guide>.pages.jsonl recording its sources, page number
+    and byte offsets into the text file. Pages can then be read one at a time, and
+    a source can be invalidated by appending a tombstone instead of rewriting the blob.
+    """
+
+    def __init__(self, text_path):
+        self.text_path = text_path
+        self.index_path = index_path_for(text_path)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_guide(cls, study_guide_dir, study_guide_name):
+        return cls(os.path.join(study_guide_dir, f"ocr-{study_guide_name}.txt"))
+
+    def has_index(self):
+        return os.path.exists(self.index_path)
+
+    def append_page(self, sources, page, text, extractor):
+        """Append one page of text; sources is a list of (file_path, content_hash) pairs."""
+        encoded = text.encode("utf-8")
+        with self._lock:
+            self._ensure_index()
+            with open(self.text_path, "ab") as text_file:
+                offset = text_file.tell()
+                # The trailing newline keeps the blob readable but is not part of the page
+                text_file.write(encoded + b"\n")
+            record = {
+                "op": "page",
+                "sources": [file_path for file_path, _ in sources],
+                "source_hashes": [content_hash for _, content_hash in sources],
+                "page": page,
+                "offset": offset,
+                "length": len(encoded),
+                "extractor": extractor,
+                "created": time.time(),
+            }
+            self._append_record(record)
+        return record
+
+    def invalidate(self, file_path, content_hash, replacement=None):
+        """Drop every page previously extracted from this version of a file.
+
+        With a replacement path, another file that still has this content, the pages
+        are kept and attributed to it instead. Returns the other (file_path, content_hash)
+        sources of the dropped pages, such as images OCR'd in the same request, whose
+        text is gone as well.
+        """
+        pair = (file_path, content_hash)
+        record = {"op": "invalidate", "source": file_path, "source_hash": content_hash, "created": time.time()}
+        others = set()
+        if replacement:
+            record["replacement"] = replacement
+        else:
+            for page in self.records():
+                page_sources = list(zip(page["sources"], page["source_hashes"]))
+                if pair in page_sources:
+                    others.update(source for source in page_sources if source != pair)
+        with self._lock:
+            self._ensure_index()
+            self._append_record(record)
+        return sorted(others)
+
+    def records(self):
+        """Return the live page records, ordered by source and page."""
+        if not self.has_index():
+            if os.path.exists(self.text_path):
+                return [self._legacy_record(os.path.getsize(self.text_path))]
+            return []
+        live = {}
+        with open(self.index_path, "r") as index_file:
+            for line in index_file:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record["op"] == "page":
+                    # A page extracted again replaces the earlier copy
+                    live[(tuple(record["source_hashes"]), record["page"])] = record
+                elif record["op"] == "invalidate":
+                    pair = (record["source"], record["source_hash"])
+                    replacement = record.get("replacement")
+                    for key, page in list(live.items()):
+                        page_sources = list(zip(page["sources"], page["source_hashes"]))
+                        if pair not in page_sources:
+                            continue
+                        if replacement:
+                            live[key] = dict(page, sources=[replacement if source == pair else source[0]
+                                                            for source in page_sources])
+                        else:
+                            del live[key]
+        return sorted(live.values(), key=lambda r: (r["sources"][0] if r["sources"] else "", r["page"] or 0))
+
+    def stored_pages(self, sources):
+        """Return the live records extracted from exactly these sources, by page number."""
+        source_hashes = [content_hash for _, content_hash in sources]
+        return {record["page"]: record for record in self.records() if record["source_hashes"] == source_hashes}
+
+    def read_page(self, record, text_file=None):
+        if text_file is None:
+            with open(self.text_path, "rb") as text_file:
+                return self.read_page(record, text_file)
+        text_file.seek(record["offset"])
+        return text_file.read(record["length"]).decode("utf-8", errors="replace")
+
+    def iter_pages(self):
+        """Yield (record, text) for each live page, reading one page at a time."""
+        records = self.records()
+        if not records:
+            return
+        with open(self.text_path, "rb") as text_file:
+            for record in records:
+                yield record, self.read_page(record, text_file)
+
+    def _ensure_index(self):
+        if self.has_index():
+            return
+        # Text appended before the index existed is kept as a single legacy page
+        if os.path.exists(self.text_path) and os.path.getsize(self.text_path) > 0:
+            self._append_record(self._legacy_record(os.path.getsize(self.text_path)))
+        else:
+            open(self.index_path, "a").close()
+
+    def _legacy_record(self, size):
+        return {"op": "page", "sources": [], "source_hashes": [], "page": None, "offset": 0,
+                "length": size, "extractor": "legacy", "created": 0}
+
+    def _append_record(self, record):
+        with open(self.index_path, "a") as index_file:
+            index_file.write(json.dumps(record) + "\n")
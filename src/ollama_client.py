@@ -0,0 +1,181 @@
+import asyncio
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+import aiohttp
+
+DEFAULT_OLLAMA_HOST = "http://localhost:11434"
+
+
+class OllamaError(Exception):
+    """Raised when a request to Ollama fails; status is None for connection errors and timeouts."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class OllamaMetrics:
+    def __init__(self, window=500):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.queued = 0
+
+    def record(self, latency, error=False):
+        with self._lock:
+            self.requests += 1
+            self.errors += int(error)
+            self._latencies.append(latency)
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+
+            def percentile(fraction):
+                return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))], 3) if latencies else None
+
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "queue_depth": self.queued,
+                "latency_p50": percentile(0.5),
+                "latency_p95": percentile(0.95),
+            }
+
+
+class OllamaClient:
+    """Pooled, keep-alive HTTP client for one Ollama host, shared by all sessions in the process.
+
+    Requests run on a dedicated background event loop so the connection pool
+    outlives the short-lived loops of individual Streamlit script runs. The
+    async methods can be awaited from any event loop.
+    """
+
+    def __init__(self, host=None, max_concurrency=None, connect_timeout=10, read_timeout=None, keepalive_timeout=60):
+        self.host = (host or os.environ.get('OLLAMA_HOST') or DEFAULT_OLLAMA_HOST).rstrip("/")
+        if not self.host.startswith(("http://", "https://")):
+            self.host = f"http://{self.host}"
+        self.max_concurrency = max_concurrency or int(os.environ.get('OLLAMA_MAX_CONNECTIONS', 4))
+        if read_timeout is None:
+            read_timeout = float(os.environ.get('OLLAMA_TIMEOUT', 600))
+        self.timeout = aiohttp.ClientTimeout(total=None, connect=connect_timeout, sock_read=read_timeout)
+        self.keepalive_timeout = keepalive_timeout
+        self.metrics = OllamaMetrics()
+        self.logger = logging.getLogger(f"streamlit_logger.{__name__}")
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="ollama-client", daemon=True)
+        self._thread.start()
+        self._session = None
+        self._semaphore = None
+
+    def close(self):
+        if self._session is not None:
+            asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result(timeout=5)
+            self._session = None
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    async def chat(self, model, messages, **options):
+        payload = {"model": model, "messages": messages, "stream": False, **options}
+        return await self.post_json("/api/chat", payload)
+
+    async def chat_stream(self, model, messages, **options):
+        """Yield the streamed chat chunks as Ollama produces them."""
+        payload = {"model": model, "messages": messages, "stream": True, **options}
+        async for chunk in self.stream_json("/api/chat", payload):
+            yield chunk
+
+    async def embed(self, model, inputs):
+        return await self.post_json("/api/embed", {"model": model, "input": inputs})
+
+    async def post_json(self, path, payload):
+        future = asyncio.run_coroutine_threadsafe(self._post_json(path, payload), self._loop)
+        return await asyncio.wrap_future(future)
+
+    async def stream_json(self, path, payload):
+        """Yield each JSON line of a streamed response."""
+        caller_loop = asyncio.get_running_loop()
+        items = asyncio.Queue()
+
+        def deliver(kind, value=None):
+            """Hand an item to the caller; returns False once the caller's event loop has closed."""
+            try:
+                caller_loop.call_soon_threadsafe(items.put_nowait, (kind, value))
+            except RuntimeError:
+                return False
+            return True
+
+        future = asyncio.run_coroutine_threadsafe(self._stream_json(path, payload, deliver), self._loop)
+        try:
+            while True:
+                kind, value = await items.get()
+                if kind == "item":
+                    yield value
+                elif kind == "error":
+                    raise value
+                else:
+                    return
+        finally:
+            # Stops generation on the server side too if the caller gives up early
+            future.cancel()
+
+    async def _post_json(self, path, payload):
+        async with self._request(path, payload) as response:
+            return await response.json(content_type=None)
+
+    async def _stream_json(self, path, payload, deliver):
+        try:
+            async with self._request(path, payload) as response:
+                async for line in response.content:
+                    # Stop reading once nobody is listening any more
+                    if line.strip() and not deliver("item", json.loads(line)):
+                        return
+            deliver("done")
+        except Exception as e:
+            # Every request failure reaches the caller, or stream_json would wait forever
+            deliver("error", e if isinstance(e, OllamaError) else OllamaError(str(e)))
+
+    @asynccontextmanager
+    async def _request(self, path, payload):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit_per_host=self.max_concurrency, keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.metrics.queued += 1
+        async with self._semaphore:
+            self.metrics.queued -= 1
+            self.metrics.in_flight += 1
+            started = time.monotonic()
+            failed = True
+            try:
+                async with self._session.post(f"{self.host}{path}", json=payload) as response:
+                    if response.status != 200:
+                        raise OllamaError(f"{response.status} - {await response.text()}", status=response.status)
+                    yield response
+                failed = False
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise OllamaError(str(e) or type(e).__name__) from e
+            finally:
+                self.metrics.in_flight -= 1
+                self.metrics.record(time.monotonic() - started, error=failed)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_ollama_client(host=None):
+    """Return the client shared by every session in this process for the given host."""
+    with _clients_lock:
+        client = _clients.get(host)
+        if client is None:
+            client = _clients[host] = OllamaClient(host)
+            atexit.register(client.close)
+        return client
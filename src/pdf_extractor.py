@@ -0,0 +1,136 @@
+import asyncio
+import importlib.util
+import io
+import multiprocessing
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import PyPDF2
+
+# image holds PNG bytes when the page had no usable text layer and was rasterized for vision OCR
+PDFPage = namedtuple("PDFPage", ["number", "text", "image"])
+
+_TEXT_PUNCTUATION = set(".,;:!?'\"()[]-%/&")
+
+
+def has_usable_text(text, min_chars=32):
+    """Heuristically decide whether an extracted text layer is real text rather than a scan or garbage."""
+    stripped = text.strip()
+    if len(stripped) < min_chars:
+        return False
+    # Fonts without a usable character map come out as replacement or private-use glyphs
+    readable = sum(c.isalnum() or c.isspace() or c in _TEXT_PUNCTUATION for c in stripped)
+    if readable / len(stripped) < 0.85:
+        return False
+    # Letter-spaced output ("T h e  c e l l") means the words were not reconstructed
+    words = stripped.split()
+    return sum(len(word) == 1 for word in words) / len(words) <= 0.5
+
+def rasterization_available():
+    return importlib.util.find_spec("pypdfium2") is not None
+
+
+def _page_count(file_path):
+    with open(file_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+def _extract_pages(file_path, start, stop, rasterize_scale=None, skip=frozenset()):
+    # Runs in a worker process, so each task opens its own reader
+    with open(file_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        pages = [PDFPage(page_num + 1, reader.pages[page_num].extract_text() or "", None)
+                 for page_num in range(start, stop) if page_num + 1 not in skip]
+    if rasterize_scale:
+        scanned = [page.number for page in pages if not has_usable_text(page.text)]
+        if scanned:
+            images = _rasterize(file_path, scanned, rasterize_scale)
+            pages = [page._replace(image=images[page.number]) if page.number in images else page for page in pages]
+    return pages
+
+def _rasterize(file_path, page_numbers, scale):
+    import pypdfium2 as pdfium
+    images = {}
+    document = pdfium.PdfDocument(file_path)
+    try:
+        for page_number in page_numbers:
+            page = document[page_number - 1]
+            buffer = io.BytesIO()
+            page.render(scale=scale).to_pil().save(buffer, format="PNG")
+            images[page_number] = buffer.getvalue()
+            page.close()
+    finally:
+        document.close()
+    return images
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_pdf_executor():
+    """Return the process pool shared by every PDF extraction in this process."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            max_workers = int(os.environ.get('PDF_WORKERS', 0)) or os.cpu_count()
+            # Spawned workers start clean instead of forking the threaded Streamlit server
+            _executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+def _discard_executor(executor):
+    # A pool whose worker died can never run tasks again, so the next caller gets a fresh one
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+class PDFExtractor:
+    """Extract PDF text off the event loop, splitting large documents across worker processes."""
+
+    def __init__(self, executor=None, pages_per_task=8, window=None):
+        self._executor = executor
+        self.pages_per_task = max(1, pages_per_task)
+        # At most this many page ranges are in flight or waiting to be consumed at once
+        self.window = window or 2 * (os.cpu_count() or 1)
+
+    async def iter_pages(self, file_path, rasterize_scale=None, skip=()):
+        """Yield a PDFPage for each page as page ranges complete; pages may arrive out of order.
+
+        With rasterize_scale set, pages without a usable text layer are rendered at that
+        scale (1.0 is 72 dpi) and returned with their PNG bytes for vision OCR. Page
+        numbers in skip are neither extracted nor yielded.
+        """
+        executor = self._executor or get_pdf_executor()
+        try:
+            async for page in self._iter_pages(executor, file_path, rasterize_scale, frozenset(skip)):
+                yield page
+        except BrokenProcessPool:
+            if self._executor is None:
+                _discard_executor(executor)
+            raise
+
+    async def _iter_pages(self, executor, file_path, rasterize_scale, skip):
+        loop = asyncio.get_running_loop()
+        page_count = await loop.run_in_executor(executor, _page_count, file_path)
+        ranges = iter([(start, min(start + self.pages_per_task, page_count))
+                       for start in range(0, page_count, self.pages_per_task)])
+        in_flight = set()
+        try:
+            while True:
+                for start, stop in ranges:
+                    in_flight.add(loop.run_in_executor(executor, _extract_pages, file_path, start, stop,
+                                                       rasterize_scale, skip))
+                    if len(in_flight) >= self.window:
+                        break
+                if not in_flight:
+                    return
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    for page in future.result():
+                        yield page
+        finally:
+            for future in in_flight:
+                future.cancel()
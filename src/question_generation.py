@@ -0,0 +1,135 @@
+import logging
+import re
+from materials_cache import cache_key
+
+QUESTIONS_NOT_AVAILABLE = "Could not generate questions."
+QUESTION_PROMPT = "generate questions: "
+
+DECODING_STRATEGIES = ('beam', 'greedy', 'sampling')
+
+_NON_WORD = re.compile(r'[^\w\s]')
+
+
+class QuestionDeduplicator:
+    """Drop questions that are exact or near duplicates of one already kept."""
+
+    def __init__(self, similarity_threshold=0.8):
+        self.similarity_threshold = similarity_threshold
+        self._seen = set()
+        self._token_sets = []
+
+    def add(self, question):
+        """Return True if the question is new and was kept."""
+        normalized = " ".join(_NON_WORD.sub(' ', question.lower()).split())
+        if not normalized or normalized in self._seen:
+            return False
+        tokens = set(normalized.split())
+        for other in self._token_sets:
+            overlap = len(tokens & other) / len(tokens | other)
+            if overlap >= self.similarity_threshold:
+                return False
+        self._seen.add(normalized)
+        self._token_sets.append(tokens)
+        return True
+
+
+class QuestionGenerator:
+    """Generate practice questions for many texts in padded batches."""
+
+    def __init__(self, tokenizer, model, batch_size=4, strategy='beam', num_questions=5, num_beams=5,
+                 max_new_tokens=150, time_budget=None, top_p=0.95, temperature=1.0,
+                 similarity_threshold=0.8, logger=None, on_progress=None, cache=None, model_id=None):
+        if strategy not in DECODING_STRATEGIES:
+            raise ValueError(f"Unknown decoding strategy '{strategy}', expected one of {DECODING_STRATEGIES}")
+        self.tokenizer = tokenizer
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.strategy = strategy
+        self.num_questions = num_questions
+        self.num_beams = num_beams
+        # Token budget per generated question and time budget in seconds per document
+        self.max_new_tokens = max_new_tokens
+        self.time_budget = time_budget
+        self.top_p = top_p
+        self.temperature = temperature
+        self.similarity_threshold = similarity_threshold
+        self.logger = logger or logging.getLogger(f"streamlit_logger.{__name__}")
+        self.on_progress = on_progress
+        self.cache = cache
+        self.model_id = model_id
+
+    def generate(self, texts):
+        """Return a flat list of unique questions across all texts."""
+        deduplicator = QuestionDeduplicator(self.similarity_threshold)
+        questions = []
+        for text_questions in self.generate_per_text(texts):
+            if text_questions is None:
+                questions.append(QUESTIONS_NOT_AVAILABLE)
+                continue
+            questions.extend(q for q in text_questions if deduplicator.add(q))
+        return questions
+
+    def generate_per_text(self, texts):
+        """Return the unique questions for each text, or None where generation failed."""
+        results = [None] * len(texts)
+        pending = list(range(len(texts)))
+        keys = {}
+        if self.cache is not None and pending:
+            params = {key: value for key, value in self.decoding_options().items() if key != 'max_time'}
+            params['similarity_threshold'] = self.similarity_threshold
+            keys = {i: cache_key('questions', self.model_id, params, texts[i]) for i in pending}
+            cached = self.cache.get_many(keys.values())
+            for i in pending:
+                results[i] = cached.get(keys[i])
+            pending = [i for i in pending if keys[i] not in cached]
+            self.logger.info("Question cache: %d hits, %d misses", len(texts) - len(pending), len(pending))
+        # Similar lengths share a batch to keep padding small
+        order = sorted(pending, key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            generated = {}
+            for index, questions in zip(batch, self._generate_batch([texts[i] for i in batch])):
+                results[index] = questions
+                if index in keys and questions is not None:
+                    generated[keys[index]] = questions
+            # Cached before reporting progress, which is where a cancelled job stops
+            if generated:
+                self.cache.put_many(generated)
+            if self.on_progress:
+                self.on_progress(len(texts) - len(order) + start + len(batch), len(texts))
+        return results
+
+    def decoding_options(self, batch_length=1):
+        options = {'max_new_tokens': self.max_new_tokens}
+        if self.time_budget:
+            options['max_time'] = self.time_budget * batch_length
+        if self.strategy == 'beam':
+            options.update(num_beams=self.num_beams, num_return_sequences=min(self.num_questions, self.num_beams),
+                           early_stopping=True)
+        elif self.strategy == 'greedy':
+            options.update(num_beams=1, do_sample=False, num_return_sequences=1)
+        else:
+            options.update(do_sample=True, top_p=self.top_p, temperature=self.temperature,
+                           num_return_sequences=self.num_questions)
+        return options
+
+    def _generate_batch(self, batch_texts):
+        try:
+            inputs = self.tokenizer([QUESTION_PROMPT + text for text in batch_texts], return_tensors="pt",
+                                    max_length=512, truncation=True, padding=True)
+            options = self.decoding_options(len(batch_texts))
+            outputs = self.model.generate(**inputs, **options)
+            decoded = self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+            per_text = options['num_return_sequences']
+            results = []
+            for start in range(0, len(decoded), per_text):
+                deduplicator = QuestionDeduplicator(self.similarity_threshold)
+                results.append([q.strip() for q in decoded[start:start + per_text] if deduplicator.add(q)])
+            self.logger.info("Generated practice questions for %d texts in one batch", len(batch_texts))
+            return results
+        except Exception as e:
+            if len(batch_texts) == 1:
+                self.logger.error("Error generating practice questions: %s", e)
+                return [None]
+            self.logger.warning("Batch question generation failed, retrying items individually: %s", e)
+            return [self._generate_batch([text])[0] for text in batch_texts]
@@ -0,0 +1,321 @@
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import namedtuple
+import joblib
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+# source is "summary" or "source"; document is the index of the text the chunk came from
+Chunk = namedtuple("Chunk", ["text", "source", "document", "position"])
+
+_WORD_PATTERN = re.compile(r'\S+')
+
+
+def estimate_tokens(text):
+    # Close enough to the chat models' tokenizers for budgeting context
+    return int(len(_WORD_PATTERN.findall(text)) * 4 / 3) + 1
+
+def chunk_text(text, chunk_words=160, overlap_words=32):
+    """Split text into overlapping word windows."""
+    words = _WORD_PATTERN.findall(text)
+    step = max(1, chunk_words - overlap_words)
+    for start in range(0, len(words), step):
+        yield " ".join(words[start:start + chunk_words])
+        if start + chunk_words >= len(words):
+            break
+
+def fingerprint_chunks(texts):
+    """Return a short fingerprint per text, so an index can tell which chunks it already holds."""
+    return [hashlib.sha256(text.encode("utf-8")).hexdigest()[:16] for text in texts]
+
+
+class DenseIndex:
+    """Sentence embeddings of the chunks, persisted as a memory-mapped matrix.
+
+    Vectors are normalized, so a dot product is the cosine similarity. The matrix is
+    saved as <path>.npy with a <path>.json sidecar recording the model and a
+    fingerprint of every chunk, so only chunks that were not embedded before are
+    encoded when the guide's text changes.
+    """
+
+    def __init__(self, embedder, path, model_id=None, dtype="float16", batch_size=64, block_rows=16384, logger=None):
+        if not path:
+            # Without one the matrix would be written to None.npy in the working directory
+            raise ValueError("A dense index needs a path to store its embeddings")
+        self.embedder = embedder
+        self.path = path
+        self.model_id = model_id
+        self.dtype = np.dtype(dtype)
+        self.batch_size = batch_size
+        self.block_rows = block_rows
+        self.logger = logger or logging.getLogger(f"streamlit_logger.{__name__}")
+        self.vectors = None
+
+    @property
+    def matrix_path(self):
+        return f"{self.path}.npy"
+
+    @property
+    def metadata_path(self):
+        return f"{self.path}.json"
+
+    def build(self, texts):
+        fingerprints = fingerprint_chunks(texts)
+        stored, stored_fingerprints = self._load()
+        if stored_fingerprints == fingerprints:
+            self.vectors = stored
+            self.logger.info("Loaded %d chunk embeddings from %s", len(texts), self.matrix_path)
+            return self
+        rows = {fingerprint: row for row, fingerprint in enumerate(stored_fingerprints or [])}
+        missing = [i for i, fingerprint in enumerate(fingerprints) if fingerprint not in rows]
+        encoded = None
+        if missing:
+            encoded = self.embedder.encode([texts[i] for i in missing], batch_size=self.batch_size,
+                                           normalize_embeddings=True, convert_to_numpy=True, show_progress_bar=False)
+            encoded = np.asarray(encoded, dtype=self.dtype).reshape(len(missing), -1)
+        dimension = encoded.shape[1] if encoded is not None else stored.shape[1]
+        vectors = np.empty((len(texts), dimension), dtype=self.dtype)
+        if encoded is not None:
+            vectors[missing] = encoded
+        reused = [i for i, fingerprint in enumerate(fingerprints) if fingerprint in rows]
+        if reused:
+            vectors[reused] = stored[[rows[fingerprints[i]] for i in reused]]
+        self._save(vectors, fingerprints)
+        self.logger.info("Embedded %d chunks into %s, reused %d", len(missing), self.matrix_path, len(reused))
+        self.vectors = np.load(self.matrix_path, mmap_mode="r")
+        return self
+
+    def scores(self, question):
+        """Return the cosine similarity of the question to every chunk."""
+        query = np.asarray(self.embedder.encode([question], normalize_embeddings=True, convert_to_numpy=True,
+                                                show_progress_bar=False), dtype=np.float32).ravel()
+        scores = np.empty(len(self.vectors), dtype=np.float32)
+        # Upcast a block at a time instead of copying the whole float16 matrix
+        for start in range(0, len(self.vectors), self.block_rows):
+            block = np.asarray(self.vectors[start:start + self.block_rows], dtype=np.float32)
+            scores[start:start + len(block)] = block @ query
+        return scores
+
+    def _load(self):
+        """Return the stored matrix and its chunk fingerprints, or (None, None) if unusable for this model."""
+        if not (os.path.exists(self.matrix_path) and os.path.exists(self.metadata_path)):
+            return None, None
+        try:
+            with open(self.metadata_path, "r") as file:
+                metadata = json.load(file)
+        except (OSError, ValueError):
+            return None, None
+        if metadata.get("model") != self.model_id or metadata.get("dtype") != self.dtype.name or \
+                "chunks" not in metadata:
+            return None, None
+        return np.load(self.matrix_path, mmap_mode="r"), metadata["chunks"]
+
+    def _save(self, vectors, fingerprints):
+        os.makedirs(os.path.dirname(self.matrix_path) or ".", exist_ok=True)
+        # Drop the old sidecar first so a half-written update is never mistaken for a valid one
+        if os.path.exists(self.metadata_path):
+            os.remove(self.metadata_path)
+        temp_path = f"{self.path}.tmp.npy"
+        np.save(temp_path, vectors)
+        os.replace(temp_path, self.matrix_path)
+        with open(self.metadata_path, "w") as file:
+            json.dump({"model": self.model_id, "dtype": self.dtype.name, "count": len(fingerprints),
+                       "dimension": vectors.shape[1], "chunks": fingerprints}, file)
+
+
+class TfidfIndex:
+    """TF-IDF vectors of the chunks, optionally persisted so sessions load them without refitting.
+
+    With a path, the fitted vectorizer is saved as <path>.joblib and the transposed
+    matrix as <path>.npz, with a <path>.json sidecar holding a fingerprint of every
+    indexed chunk. Chunks the index already holds keep their columns wherever they
+    now appear; new chunks are transformed with the saved vocabulary and appended.
+    Once chunks added or removed that way exceed drift_threshold of the fitted
+    chunks, the vectorizer is refitted so new terms and document frequencies are
+    picked up.
+    """
+
+    def __init__(self, path=None, drift_threshold=0.25, logger=None):
+        self.path = path
+        self.drift_threshold = drift_threshold
+        self.logger = logger or logging.getLogger(f"streamlit_logger.{__name__}")
+        self.vectorizer = None
+        # term x chunk, so a query only touches the rows of its own terms
+        self.term_chunks = None
+        self.fitted_count = 0
+        # Chunks added or removed since the vectorizer was fitted
+        self.drift = 0
+
+    def build(self, texts):
+        fingerprints = fingerprint_chunks(texts)
+        metadata = self._read_metadata() if self.path else None
+        if metadata and "chunks" in metadata:
+            columns = {fingerprint: column for column, fingerprint in enumerate(metadata["chunks"])}
+            added = [i for i, fingerprint in enumerate(fingerprints) if fingerprint not in columns]
+            removed = len(columns.keys() - set(fingerprints))
+            drift = metadata["drift"] + len(added) + removed
+            if drift <= self.drift_threshold * metadata["fitted_count"]:
+                self.vectorizer = joblib.load(f"{self.path}.joblib")
+                self.term_chunks = sparse.load_npz(f"{self.path}.npz").tocsr()
+                self.fitted_count = metadata["fitted_count"]
+                self.drift = drift
+                if not added and not removed and fingerprints == metadata["chunks"]:
+                    self.logger.info("Loaded TF-IDF index of %d chunks from %s", len(texts), self.path)
+                    return self
+                self._update(texts, fingerprints, columns, added)
+                self.logger.info("Reused %d chunks of the TF-IDF index, appended %d", len(texts) - len(added),
+                                 len(added))
+                self._save(fingerprints)
+                return self
+        self._fit(texts)
+        if self.path and self.term_chunks is not None:
+            self._save(fingerprints)
+        return self
+
+    def scores(self, question):
+        if self.term_chunks is None:
+            return None
+        query = self.vectorizer.transform([question])
+        if not query.nnz:
+            return None
+        return (query @ self.term_chunks).toarray().ravel()
+
+    def _update(self, texts, fingerprints, columns, added):
+        """Put the stored columns in the order of texts, transforming only the chunks not stored yet."""
+        new_columns = {i: self.term_chunks.shape[1] + offset for offset, i in enumerate(added)}
+        if added:
+            matrix = self.vectorizer.transform([texts[i] for i in added])
+            self.term_chunks = sparse.hstack([self.term_chunks, matrix.T], format="csr")
+        order = [new_columns[i] if i in new_columns else columns[fingerprint]
+                 for i, fingerprint in enumerate(fingerprints)]
+        # Column selection also drops chunks that are gone
+        self.term_chunks = self.term_chunks.tocsc()[:, order].tocsr()
+
+    def _fit(self, texts):
+        self.vectorizer = TfidfVectorizer(sublinear_tf=True, stop_words="english")
+        try:
+            matrix = self.vectorizer.fit_transform(texts)
+        except ValueError:
+            # Every chunk was stop words only
+            self.vectorizer = self.term_chunks = None
+            return
+        self.term_chunks = matrix.T.tocsr()
+        self.fitted_count = len(texts)
+        self.drift = 0
+        self.logger.info("Indexed %d chunks over %d terms", len(texts), matrix.shape[1])
+
+    def _read_metadata(self):
+        try:
+            with open(f"{self.path}.json", "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, fingerprints):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        metadata_path = f"{self.path}.json"
+        if os.path.exists(metadata_path):
+            os.remove(metadata_path)
+        joblib.dump(self.vectorizer, f"{self.path}.tmp.joblib")
+        os.replace(f"{self.path}.tmp.joblib", f"{self.path}.joblib")
+        # Uncompressed: compressing costs seconds on every append and saves little on TF-IDF weights
+        sparse.save_npz(f"{self.path}.tmp.npz", self.term_chunks, compressed=False)
+        os.replace(f"{self.path}.tmp.npz", f"{self.path}.npz")
+        with open(metadata_path, "w") as file:
+            json.dump({"count": len(fingerprints), "fitted_count": self.fitted_count, "drift": self.drift,
+                       "chunks": fingerprints}, file)
+
+
+class RetrievalIndex:
+    """Chunk-level index over a guide's summaries and OCR source text.
+
+    The TF-IDF matrix is kept transposed (term x chunk) in CSR form, so scoring a
+    question only touches the rows of the terms it contains, much like walking an
+    inverted index, and stays fast with tens of thousands of chunks. With a
+    tfidf_path it is persisted and reused across sessions.
+
+    mode is "tfidf", "dense" (requires a DenseIndex) or "hybrid", which blends the
+    two scores with dense_weight.
+    """
+
+    MODES = ("tfidf", "dense", "hybrid")
+
+    def __init__(self, chunk_words=160, overlap_words=32, logger=None, dense=None, mode="tfidf", dense_weight=0.5,
+                 tfidf_path=None):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        if mode != "tfidf" and dense is None:
+            raise ValueError(f"Retrieval mode '{mode}' needs a dense index")
+        self.chunk_words = chunk_words
+        self.overlap_words = overlap_words
+        self.logger = logger or logging.getLogger(f"streamlit_logger.{__name__}")
+        self.dense = dense
+        self.mode = mode
+        self.dense_weight = dense_weight
+        self.chunks = []
+        self.tfidf = TfidfIndex(tfidf_path, logger=self.logger)
+        self._built = False
+
+    def add_texts(self, texts, source):
+        for document, text in enumerate(texts):
+            if not text or not text.strip():
+                continue
+            for position, chunk in enumerate(chunk_text(text, self.chunk_words, self.overlap_words)):
+                self.chunks.append(Chunk(chunk, source, document, position))
+        self._built = False
+
+    def build(self):
+        self._built = True
+        if not self.chunks:
+            return self
+        if self.mode != "tfidf":
+            self.dense.build([chunk.text for chunk in self.chunks])
+        if self.mode != "dense":
+            self.tfidf.build([chunk.text for chunk in self.chunks])
+        return self
+
+    def search(self, question, k=5, min_score=0.05):
+        """Return up to k (score, chunk) pairs scoring at least min_score, best first."""
+        if not self._built:
+            self.build()
+        if not self.chunks:
+            return []
+        scores = self._scores(question)
+        if scores is None:
+            return []
+        candidates = np.flatnonzero(scores >= min_score)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(scores[candidates], -k)[-k:]]
+        ranked = candidates[np.argsort(-scores[candidates])]
+        return [(float(scores[i]), self.chunks[i]) for i in ranked]
+
+    def _scores(self, question):
+        tfidf = self.tfidf.scores(question) if self.mode != "dense" else None
+        if self.mode == "tfidf":
+            return tfidf
+        dense = self.dense.scores(question)
+        if self.mode == "dense" or tfidf is None:
+            return dense if self.mode == "dense" else self.dense_weight * dense
+        return self.dense_weight * dense + (1 - self.dense_weight) * tfidf
+
+    def context_for(self, question, k=5, min_score=0.05, max_tokens=1500):
+        """Assemble the best matching chunks into a context of at most max_tokens."""
+        return assemble_context(self.search(question, k, min_score), max_tokens)
+
+
+def assemble_context(results, max_tokens=1500):
+    selected = []
+    used = 0
+    for _, chunk in results:
+        tokens = estimate_tokens(chunk.text)
+        if used + tokens > max_tokens:
+            continue
+        selected.append(chunk)
+        used += tokens
+    # Keep chunks of the same document in reading order
+    selected.sort(key=lambda chunk: (chunk.source, chunk.document, chunk.position))
+    return "\n\n".join(chunk.text for chunk in selected)
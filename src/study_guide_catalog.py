@@ -0,0 +1,122 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from ocr_store import OCRPageStore
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+DOCUMENT_EXTENSIONS = IMAGE_EXTENSIONS + ('.pdf',)
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class TextHandle:
+    """One OCR text file of a guide, read only when its pages are asked for and reread only when it changes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.store = OCRPageStore(path)
+        self._signature = None
+        self._pages = None
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    def pages(self):
+        # The page index changes along with the text, so both are part of the signature
+        signature = (_signature(self.path), _signature(self.store.index_path))
+        if self._pages is None or signature != self._signature:
+            if self.store.has_index():
+                self._pages = [text for _, text in self.store.iter_pages()]
+            else:
+                with open(self.path, "r") as f:
+                    self._pages = [f.read()]
+            self._signature = signature
+        return self._pages
+
+
+class GuideListing:
+    """Cached directory listing of one study guide."""
+
+    def __init__(self, path, signature, files):
+        self.path = path
+        self.signature = signature
+        self.files = files
+        self.text_handles = [TextHandle(os.path.join(path, file)) for file in files if file.endswith(".txt")]
+
+    @property
+    def images(self):
+        return [file for file in self.files if file.lower().endswith(IMAGE_EXTENSIONS)]
+
+    @property
+    def documents(self):
+        return [file for file in self.files if file.lower().endswith(DOCUMENT_EXTENSIONS)]
+
+    def has_file(self, name):
+        return name in self.files
+
+    def texts(self):
+        """Return the guide's text documents, one per OCR page where an index exists."""
+        return [page for handle in self.text_handles for page in handle.pages()]
+
+
+class StudyGuideCatalog:
+    """Process-wide cache of the study guides on disk.
+
+    Listings are keyed by the directory's mtime, which changes whenever a file is
+    added, removed or renamed, so an unchanged guide costs one stat per rerun.
+    Text files are checked by their own mtime and size and only reread when they
+    change.
+    """
+
+    def __init__(self, root="study_guides", max_guides=16):
+        self.root = root
+        self.max_guides = max_guides
+        self.logger = logging.getLogger(f"streamlit_logger.{__name__}")
+        self._lock = threading.Lock()
+        self._guides = None
+        self._listings = OrderedDict()
+
+    def guides(self):
+        """Return the names of the study guides, sorted."""
+        signature = _signature(self.root)
+        with self._lock:
+            if self._guides is None or self._guides[0] != signature:
+                names = sorted(entry.name for entry in os.scandir(self.root)
+                               if entry.is_dir() and not entry.name.startswith('.')) if signature else []
+                self._guides = (signature, names)
+            return self._guides[1]
+
+    def guide(self, name):
+        path = os.path.join(self.root, name)
+        signature = _signature(path)
+        with self._lock:
+            listing = self._listings.get(name)
+            if listing is None or listing.signature != signature:
+                files = sorted(entry.name for entry in os.scandir(path) if entry.is_file()) if signature else []
+                listing = self._listings[name] = GuideListing(path, signature, files)
+                self.logger.info("Listed study guide '%s': %d files", name, len(files))
+            # Least recently viewed guides drop out along with their cached text
+            self._listings.move_to_end(name)
+            while len(self._listings) > self.max_guides:
+                self._listings.popitem(last=False)
+            return listing
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+def get_study_guide_catalog():
+    """Return the catalog shared by every session in this process."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = StudyGuideCatalog()
+        return _catalog
@@ -0,0 +1,229 @@
+import logging
+import re
+from collections import deque
+from itertools import islice
+from materials_cache import cache_key
+
+SUMMARY_NOT_AVAILABLE = "Summary not available."
+
+# Sentences or lines, whichever ends first
+_PIECE_PATTERN = re.compile(r'[^.!?\n]*(?:[.!?\n]+|$)')
+
+
+class BatchSummarizer:
+    """Summarize many texts with length-bucketed, padded mini-batches."""
+
+    def __init__(self, summarizer, batch_size=8, bucket_width=64, max_summary_length=130, min_summary_length=30, logger=None,
+                 tokenizer=None, cache=None, model_id=None):
+        self.summarizer = summarizer
+        self.tokenizer = tokenizer
+        self.cache = cache
+        self.model_id = model_id
+        self.batch_size = max(1, batch_size)
+        self.bucket_width = max(1, bucket_width)
+        self.max_summary_length = max_summary_length
+        self.min_summary_length = min_summary_length
+        self.logger = logger or logging.getLogger(f"streamlit_logger.{__name__}")
+
+    def summarize(self, texts, on_progress=None):
+        """Return one summary per text, in input order; on_progress(done, total) is called after every batch."""
+        summaries = [SUMMARY_NOT_AVAILABLE] * len(texts)
+        # Empty texts never reach the model and keep the fallback summary
+        pending = [i for i, text in enumerate(texts) if text and text.strip()]
+        keys = {}
+        if self.cache is not None and pending:
+            params = {'max_length': self.max_summary_length, 'min_length': self.min_summary_length}
+            keys = {i: cache_key('summary', self.model_id, params, texts[i]) for i in pending}
+            cached = self.cache.get_many(keys.values())
+            for i in pending:
+                if keys[i] in cached:
+                    summaries[i] = cached[keys[i]]
+            pending = [i for i in pending if keys[i] not in cached]
+            self.logger.info("Summary cache: %d hits, %d misses", len(keys) - len(pending), len(pending))
+        done = len(texts) - len(pending)
+        if on_progress:
+            on_progress(done, len(texts))
+        for batch in self._batches(texts, pending):
+            batch_texts = [texts[i] for i in batch]
+            # Size the summary for the longest input in the bucket, like the per-item limit did
+            input_length = max(len(text.split()) for text in batch_texts)
+            max_length = min(self.max_summary_length, input_length)
+            generated = {}
+            for index, summary in zip(batch, self._summarize_batch(batch_texts, max_length)):
+                summaries[index] = summary
+                if index in keys and summary != SUMMARY_NOT_AVAILABLE:
+                    generated[keys[index]] = summary
+            # Cached per batch, so a cancelled or crashed job keeps every finished batch
+            if generated:
+                self.cache.put_many(generated)
+            done += len(batch)
+            if on_progress:
+                on_progress(done, len(texts))
+        return summaries
+
+    def _batches(self, texts, indices):
+        if not indices:
+            return
+        lengths = dict(zip(indices, self._token_lengths([texts[i] for i in indices])))
+        order = sorted(indices, key=lambda i: lengths[i])
+        batch = []
+        bucket = None
+        for index in order:
+            index_bucket = lengths[index] // self.bucket_width
+            if batch and (index_bucket != bucket or len(batch) == self.batch_size):
+                yield batch
+                batch = []
+            bucket = index_bucket
+            batch.append(index)
+        if batch:
+            yield batch
+
+    def _token_lengths(self, texts):
+        tokenizer = self.tokenizer or getattr(self.summarizer, "tokenizer", None)
+        if tokenizer is not None:
+            try:
+                encoded = tokenizer(list(texts), add_special_tokens=False)["input_ids"]
+                return [len(ids) for ids in encoded]
+            except Exception as e:
+                self.logger.warning("Falling back to word counts for bucketing: %s", e)
+        return [len(text.split()) for text in texts]
+
+    def _summarize_batch(self, batch_texts, max_length):
+        min_length = min(self.min_summary_length, max_length)
+        try:
+            results = self.summarizer(batch_texts, max_length=max_length, min_length=min_length,
+                                      do_sample=False, truncation=True, batch_size=len(batch_texts))
+            self.logger.info("Generated %d summaries in one batch", len(batch_texts))
+            return [self._summary_text(result) for result in results]
+        except Exception as e:
+            if len(batch_texts) == 1:
+                self.logger.error("Error generating summary: %s", e)
+                return [SUMMARY_NOT_AVAILABLE]
+            # Retry one at a time so a single bad input only loses its own summary
+            self.logger.warning("Batch summarization failed, retrying items individually: %s", e)
+            return [self._summarize_batch([text], max_length)[0] for text in batch_texts]
+
+    def _summary_text(self, result):
+        # A pipeline returns a list of candidates per input when given a list
+        if isinstance(result, list):
+            result = result[0] if result else None
+        if result and result.get('summary_text'):
+            return result['summary_text']
+        self.logger.warning("Summarizer returned an empty result")
+        return SUMMARY_NOT_AVAILABLE
+
+
+class HierarchicalSummarizer:
+    """Summarize texts of any length by chunking, summarizing chunks and merging the partial summaries."""
+
+    def __init__(self, summarizer, batch_size=8, chunk_tokens=None, overlap_tokens=64, window_batches=4, max_rounds=5,
+                 logger=None, on_progress=None, tokenizer=None, cache=None, model_id=None):
+        self.on_progress = on_progress
+        self.logger = logger or logging.getLogger(f"streamlit_logger.{__name__}")
+        self.tokenizer = tokenizer or summarizer.tokenizer
+        # Chunk summaries are cached individually, so appending a page only summarizes the new chunks
+        self.batch_summarizer = BatchSummarizer(summarizer, batch_size=batch_size, logger=self.logger,
+                                                tokenizer=self.tokenizer, cache=cache, model_id=model_id)
+        if chunk_tokens is None:
+            # Leave room for the special tokens the model adds around every input
+            chunk_tokens = min(self.tokenizer.model_max_length, 1024) - self.tokenizer.num_special_tokens_to_add()
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = min(overlap_tokens, chunk_tokens // 2)
+        # Only this many chunks are held in memory at once during the map step
+        self.window_size = max(1, batch_size * window_batches)
+        self.max_rounds = max_rounds
+
+    def summarize(self, texts):
+        """Return one summary per text, in input order."""
+        summaries = [SUMMARY_NOT_AVAILABLE] * len(texts)
+        pending = {i: text for i, text in enumerate(texts) if text and text.strip()}
+        self._report(len(texts) - len(pending), len(texts))
+        for round_number in range(self.max_rounds):
+            fitting = [i for i, text in pending.items() if self._fits(text)]
+            finished = len(texts) - len(pending)
+            for i, summary in zip(fitting, self.batch_summarizer.summarize(
+                    [pending[i] for i in fitting], on_progress=self._batch_progress(finished, len(texts)))):
+                summaries[i] = summary
+            pending = {i: text for i, text in pending.items() if i not in fitting}
+            self._report(len(texts) - len(pending), len(texts))
+            if not pending:
+                break
+            self.logger.info("Map-reduce round %d over %d long texts", round_number + 1, len(pending))
+            # Chunk batches do not finish any text, but still report so the job can be cancelled
+            pending = self._map(pending, self._batch_progress(len(texts) - len(pending), len(texts), counts=False))
+        if pending:
+            # Out of rounds: let the model truncate what is left rather than loop forever
+            self.logger.warning("Summaries for %d texts still exceed the model window", len(pending))
+            for i, summary in zip(pending, self.batch_summarizer.summarize(
+                    list(pending.values()), on_progress=self._batch_progress(len(texts) - len(pending), len(texts)))):
+                summaries[i] = summary
+            self._report(len(texts), len(texts))
+        return summaries
+
+    def _report(self, done, total):
+        if self.on_progress:
+            self.on_progress(done, total)
+
+    def _batch_progress(self, finished, total, counts=True):
+        """Return a BatchSummarizer progress callback that reports overall progress, offset by finished texts."""
+        if not self.on_progress:
+            return None
+        return lambda done, _: self._report(finished + done if counts else finished, total)
+
+    def iter_chunks(self, text):
+        """Yield chunks of at most chunk_tokens tokens, consecutive chunks sharing overlap_tokens."""
+        pieces = deque()
+        chunk_length = 0
+        for piece, length in self._iter_pieces(text):
+            if pieces and chunk_length + length > self.chunk_tokens:
+                yield " ".join(p for p, _ in pieces)
+                # Carry the tail of the chunk over so context spans the boundary
+                overlap = deque()
+                overlap_length = 0
+                while pieces and overlap_length + pieces[-1][1] <= self.overlap_tokens:
+                    overlap.appendleft(pieces.pop())
+                    overlap_length += overlap[0][1]
+                # Drop the oldest overlap pieces if the next piece would not fit alongside them
+                while overlap and overlap_length + length > self.chunk_tokens:
+                    overlap_length -= overlap.popleft()[1]
+                pieces = overlap
+                chunk_length = overlap_length
+            pieces.append((piece, length))
+            chunk_length += length
+        if pieces:
+            yield " ".join(p for p, _ in pieces)
+
+    def _iter_pieces(self, text):
+        for match in _PIECE_PATTERN.finditer(text):
+            piece = match.group().strip()
+            if not piece:
+                continue
+            ids = self.tokenizer.encode(piece, add_special_tokens=False)
+            if len(ids) <= self.chunk_tokens:
+                yield piece, len(ids)
+                continue
+            # A single run-on sentence longer than the window is split on token boundaries
+            step = self.chunk_tokens - self.overlap_tokens
+            for start in range(0, len(ids), step):
+                window = ids[start:start + self.chunk_tokens]
+                yield self.tokenizer.decode(window), len(window)
+
+    def _fits(self, text):
+        # Every token covers at least one character, so short texts skip tokenization
+        if len(text) <= self.chunk_tokens:
+            return True
+        return len(self.tokenizer.encode(text, add_special_tokens=False)) <= self.chunk_tokens
+
+    def _map(self, texts, on_progress=None):
+        partials = {i: [] for i in texts}
+        # Chunks from every text share batches so short tails don't run alone
+        chunks = ((i, chunk) for i, text in texts.items() for chunk in self.iter_chunks(text))
+        while True:
+            window = list(islice(chunks, self.window_size))
+            if not window:
+                break
+            summaries = self.batch_summarizer.summarize([chunk for _, chunk in window], on_progress=on_progress)
+            for (i, _), summary in zip(window, summaries):
+                if summary != SUMMARY_NOT_AVAILABLE:
+                    partials[i].append(summary)
+        return {i: " ".join(parts) for i, parts in partials.items() if parts}
@@ -0,0 +1,96 @@
+import json
+import logging
+import os
+import threading
+from PIL import Image, ImageOps, features
+from ocr_manifest import hash_file
+
+
+class ThumbnailCache:
+    """Small thumbnails of a guide's images, generated once per content hash.
+
+    Thumbnails are stored under <guide>/.cache/thumbnails as <hash>-<size>.webp
+    (JPEG where Pillow lacks WebP). An index maps each image to its size, mtime and
+    hash, so an unchanged image is neither rehashed nor decoded again.
+    """
+
+    def __init__(self, study_guide_dir, size=256, quality=80):
+        self.study_guide_dir = study_guide_dir
+        self.cache_dir = os.path.join(study_guide_dir, ".cache", "thumbnails")
+        self.index_path = os.path.join(self.cache_dir, "index.json")
+        self.size = size
+        self.quality = quality
+        self.image_format, self.extension = ("WEBP", "webp") if features.check("webp") else ("JPEG", "jpg")
+        self.logger = logging.getLogger(f"streamlit_logger.{__name__}")
+        self._lock = threading.Lock()
+        self._index = None
+        self._dirty = False
+
+    def thumbnail(self, image_file):
+        """Return the path of the thumbnail for an image in the guide, creating it if needed."""
+        image_path = os.path.join(self.study_guide_dir, image_file)
+        stat = os.stat(image_path)
+        with self._lock:
+            index = self._load_index()
+            entry = index.get(image_file)
+            if entry is None or entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime_ns:
+                entry = index[image_file] = {"size": stat.st_size, "mtime": stat.st_mtime_ns,
+                                             "hash": hash_file(image_path)}
+                self._dirty = True
+        thumbnail_path = os.path.join(self.cache_dir, f"{entry['hash']}-{self.size}.{self.extension}")
+        if not os.path.exists(thumbnail_path):
+            self._render(image_path, thumbnail_path)
+        return thumbnail_path
+
+    def thumbnails(self, image_files):
+        """Return thumbnail paths for the given images, saving the index once afterwards."""
+        try:
+            return [self.thumbnail(image_file) for image_file in image_files]
+        finally:
+            self.save_index()
+
+    def save_index(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = f"{self.index_path}.tmp"
+            with open(temp_path, "w") as file:
+                json.dump(self._index, file)
+            os.replace(temp_path, self.index_path)
+            self._dirty = False
+
+    def _load_index(self):
+        if self._index is None:
+            try:
+                with open(self.index_path, "r") as file:
+                    self._index = json.load(file)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _render(self, image_path, thumbnail_path):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with Image.open(image_path) as image:
+            # draft() lets the JPEG decoder downscale while decoding instead of loading every pixel
+            image.draft("RGB", (self.size, self.size))
+            thumbnail = ImageOps.exif_transpose(image)
+            thumbnail.thumbnail((self.size, self.size))
+            if thumbnail.mode not in ("RGB", "L"):
+                thumbnail = thumbnail.convert("RGB")
+        temp_path = f"{thumbnail_path}.tmp"
+        thumbnail.save(temp_path, format=self.image_format, quality=self.quality)
+        os.replace(temp_path, thumbnail_path)
+        self.logger.info("Created thumbnail for %s", image_path)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_thumbnail_cache(study_guide_dir):
+    """Return the thumbnail cache shared by every session for a guide directory."""
+    with _caches_lock:
+        cache = _caches.get(study_guide_dir)
+        if cache is None:
+            cache = _caches[study_guide_dir] = ThumbnailCache(study_guide_dir)
+        return cache
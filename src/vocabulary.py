@@ -0,0 +1,161 @@
+import functools
+import heapq
+import logging
+import math
+import os
+import re
+import sqlite3
+import unicodedata
+from collections import Counter
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+from materials_store import MaterialsStore
+
+# Runs of letters, keeping inner apostrophes and hyphens ("don't", "cell-wall"); digits and punctuation split words
+_WORD_PATTERN = re.compile(r"[^\W\d_]+(?:['’-][^\W\d_]+)*")
+
+ENGLISH_COUNTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "english_word_counts.txt")
+
+
+def iter_tokens(texts, stopwords=ENGLISH_STOP_WORDS, min_length=3):
+    """Yield normalized words from the texts one at a time, without joining them."""
+    for text in texts:
+        for match in _WORD_PATTERN.finditer(text):
+            word = unicodedata.normalize("NFKC", match.group()).lower().replace("’", "'")
+            if len(word) >= min_length and word not in stopwords:
+                yield word
+
+
+class SpaceSaving:
+    """Approximate top-k counter in bounded memory (the Space-Saving heavy-hitters algorithm).
+
+    At most capacity words are tracked. A new word replaces the least counted one and
+    inherits its count, so counts are over-estimates by at most the smallest tracked
+    count, and every word more frequent than total / capacity is guaranteed to be kept.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = max(1, capacity)
+        self.counts = {}
+        self.total = 0
+        # Min-heap of (count, word); stale entries are skipped when popped
+        self._heap = []
+
+    def add(self, word):
+        self.total += 1
+        if word in self.counts:
+            self.counts[word] += 1
+        elif len(self.counts) < self.capacity:
+            self.counts[word] = 1
+        else:
+            count, evicted = self._pop_min()
+            del self.counts[evicted]
+            self.counts[word] = count + 1
+        heapq.heappush(self._heap, (self.counts[word], word))
+        if len(self._heap) > 4 * self.capacity:
+            # Drop stale entries so the heap stays bounded too
+            self._heap = [(count, word) for word, count in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def most_common(self, n=None):
+        return Counter(self.counts).most_common(n)
+
+    def _pop_min(self):
+        while True:
+            count, word = heapq.heappop(self._heap)
+            if self.counts.get(word) == count:
+                return count, word
+
+
+def log_likelihood(count, total, background_count, background_total):
+    """Signed log-likelihood (G2) keyness of a word against a background corpus; negative if it is rarer here."""
+    combined = (count + background_count) / (total + background_total)
+    expected = total * combined
+    expected_background = background_total * combined
+    g2 = 0.0
+    if count:
+        g2 += count * math.log(count / expected)
+    if background_count:
+        g2 += background_count * math.log(background_count / expected_background)
+    g2 *= 2
+    return g2 if count / total >= background_count / background_total else -g2
+
+
+def build_vocabulary(texts, top_n=None, capacity=None, background=None, stopwords=ENGLISH_STOP_WORDS, min_length=3):
+    """Return [(word, count)] for the texts, most characteristic first.
+
+    With top_n, words are counted with a SpaceSaving sketch of capacity words
+    (10 x top_n by default), so memory and output are bounded whatever the corpus
+    size. With a background frequency table, words are ranked by keyness against it
+    instead of raw counts.
+    """
+    if top_n:
+        counter = SpaceSaving(capacity or 10 * top_n)
+        for word in iter_tokens(texts, stopwords, min_length):
+            counter.add(word)
+        total = counter.total
+    else:
+        counter = Counter(iter_tokens(texts, stopwords, min_length))
+        total = sum(counter.values())
+    ranked = counter.most_common()
+    if background and total:
+        background_total = sum(background.values())
+        ranked.sort(key=lambda item: log_likelihood(item[1], total, background.get(item[0], 0), background_total),
+                    reverse=True)
+    return ranked[:top_n] if top_n else ranked
+
+
+@functools.lru_cache(maxsize=None)
+def _read_counts(path):
+    counts = {}
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.startswith("#") or not line.strip():
+                continue
+            word, count = line.split()
+            counts[word] = int(count)
+    return counts
+
+
+def english_background(path=ENGLISH_COUNTS_PATH):
+    """Return the shipped general-English frequency table, read once per process."""
+    return Counter(_read_counts(path))
+
+
+def combine_backgrounds(*tables):
+    """Merge frequency tables with equal weight, scaling each to the total of the first."""
+    tables = [table for table in tables if table]
+    if not tables:
+        return Counter()
+    target = sum(tables[0].values())
+    combined = Counter()
+    for table in tables:
+        scale = target / sum(table.values())
+        for word, count in table.items():
+            combined[word] += count * scale
+    return combined
+
+
+def background_from_guides(study_guides_root, exclude=None, logger=None):
+    """Sum the saved vocabulary counts of the other study guides into a background frequency table."""
+    logger = logger or logging.getLogger(f"streamlit_logger.{__name__}")
+    background = Counter()
+    if not os.path.isdir(study_guides_root):
+        return background
+    for entry in os.scandir(study_guides_root):
+        if not entry.is_dir() or entry.name == exclude:
+            continue
+        store_path = os.path.join(entry.path, "materials.sqlite")
+        # Guides without generated materials have nothing to contribute
+        if not os.path.exists(store_path):
+            continue
+        counts = Counter()
+        try:
+            # Read-only, so a sibling guide's store is never created, migrated or locked for writing
+            for word, count in MaterialsStore(store_path, readonly=True).section("vocab_list"):
+                # Lists saved before normalization still contain mixed case
+                counts[word.lower()] += count
+        except (ValueError, sqlite3.Error) as e:
+            logger.warning("Skipping background vocabulary from %s: %s", entry.path, e)
+            continue
+        background.update(counts)
+    return background
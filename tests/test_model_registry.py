@@ -0,0 +1,37 @@
+from model_registry import ModelRegistry
+
+
+class FakeModel:
+    def __init__(self, registry):
+        self.registry = registry
+        self.name = "fake"
+
+    def generate(self):
+        # The model must not be evictable while one of its methods runs
+        return self.registry.evict("model")
+
+
+def test_proxy_method_calls_hold_a_lease():
+    registry = ModelRegistry(memory_budget_mb=0)
+    registry.register("model", lambda: FakeModel(registry))
+    proxy = registry.proxy("model")
+    assert proxy.name == "fake"
+    assert proxy.generate() is False
+    assert registry.evict("model") is True
+
+
+class SizedModel:
+    def __init__(self, megabytes):
+        self.megabytes = megabytes
+
+
+def test_budget_is_enforced_when_the_last_lease_is_released(monkeypatch):
+    monkeypatch.setattr("model_registry._estimate_size", lambda model: int(model.megabytes * 1024 * 1024))
+    registry = ModelRegistry(memory_budget_mb=2.5)
+    registry.register("a", lambda: SizedModel(1.5))
+    registry.register("b", lambda: SizedModel(1.5))
+    with registry.lease("a"):
+        # Over budget, but "a" is leased and "b" was just loaded, so nothing can go yet
+        registry.get("b")
+        assert registry.memory_usage() == 3 * 1024 * 1024
+    assert registry.memory_usage() <= 2.5 * 1024 * 1024
@@ -0,0 +1,28 @@
+import asyncio
+from ocr_scheduler import OCRRequestError, OCRScheduler
+
+
+def test_unexpected_send_error_fails_only_that_group():
+    async def send(group):
+        if group == [2]:
+            raise KeyError("unexpected")
+        return f"text {group[0]}"
+
+    scheduler = OCRScheduler(send, max_in_flight=2, max_retries=1, backoff=0)
+    results = asyncio.run(asyncio.wait_for(scheduler.run([1, 2, 3]), timeout=5))
+    assert sorted((group[0], text) for group, text, _ in results) == [(1, "text 1"), (2, None), (3, "text 3")]
+
+
+def test_retryable_error_is_sent_again():
+    attempts = []
+
+    async def send(group):
+        attempts.append(group)
+        if len(attempts) == 1:
+            raise OCRRequestError("busy")
+        return "done"
+
+    scheduler = OCRScheduler(send, max_in_flight=1, max_retries=2, backoff=0)
+    results = asyncio.run(scheduler.run([1]))
+    assert [text for _, text, _ in results] == ["done"]
+    assert len(attempts) == 2
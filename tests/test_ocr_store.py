@@ -0,0 +1,23 @@
+from ocr_store import OCRPageStore
+
+
+def test_invalidate_keeps_pages_still_needed_by_a_duplicate(tmp_path):
+    store = OCRPageStore(str(tmp_path / "ocr-guide.txt"))
+    store.append_page([("a.png", "h1")], 1, "first", "vision")
+    store.append_page([("c.png", "h3")], 1, "other", "vision")
+
+    store.invalidate("a.png", "h1", replacement="b.png")
+    assert sorted((record["sources"], text) for record, text in store.iter_pages()) == [
+        (["b.png"], "first"), (["c.png"], "other")]
+
+    store.invalidate("b.png", "h1")
+    assert [text for _, text in store.iter_pages()] == ["other"]
+
+
+def test_invalidate_reports_other_sources_of_dropped_pages(tmp_path):
+    store = OCRPageStore(str(tmp_path / "ocr-guide.txt"))
+    # Two images OCR'd in one request share a single page
+    store.append_page([("a.png", "h1"), ("b.png", "h2")], 1, "both", "vision")
+
+    assert store.invalidate("a.png", "h1") == [("b.png", "h2")]
+    assert store.records() == []
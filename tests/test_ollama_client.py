@@ -0,0 +1,24 @@
+import asyncio
+from contextlib import asynccontextmanager
+import pytest
+from ollama_client import OllamaClient, OllamaError
+
+
+def test_stream_json_raises_request_runtime_errors():
+    client = OllamaClient("http://localhost:1")
+
+    @asynccontextmanager
+    async def closed_session(path, payload):
+        raise RuntimeError("Session is closed")
+        yield
+
+    client._request = closed_session
+
+    async def consume():
+        return [item async for item in client.stream_json("/api/chat", {})]
+
+    try:
+        with pytest.raises(OllamaError, match="Session is closed"):
+            asyncio.run(asyncio.wait_for(consume(), timeout=5))
+    finally:
+        client.close()
@@ -0,0 +1,42 @@
+import pytest
+from materials_cache import MaterialCache
+from question_generation import QuestionGenerator
+
+
+class Stop(Exception):
+    pass
+
+
+class FakeTokenizer:
+    def __call__(self, texts, **kwargs):
+        return {"input_ids": texts}
+
+    def batch_decode(self, outputs, skip_special_tokens=True):
+        return outputs
+
+
+class FakeModel:
+    def generate(self, input_ids, num_return_sequences=1, **kwargs):
+        return [f"What about {text.split()[-1]}?" for text in input_ids for _ in range(num_return_sequences)]
+
+
+def test_finished_batches_are_cached_when_a_run_stops(tmp_path):
+    cache = MaterialCache(str(tmp_path / "cache.sqlite"))
+    texts = [f"text number {i}" for i in range(20)]
+
+    def stop_after_three_batches(done, total):
+        if done >= 12:
+            raise Stop()
+
+    generator = QuestionGenerator(FakeTokenizer(), FakeModel(), batch_size=4, strategy='greedy', cache=cache,
+                                  model_id="fake", on_progress=stop_after_three_batches)
+    with pytest.raises(Stop):
+        generator.generate_per_text(texts)
+
+    resumed = QuestionGenerator(FakeTokenizer(), FakeModel(), batch_size=4, strategy='greedy', cache=cache,
+                                model_id="fake")
+    model_calls = []
+    resumed.model.generate = lambda **kwargs: model_calls.append(kwargs) or FakeModel().generate(**kwargs)
+    results = resumed.generate_per_text(texts)
+    assert sum(len(call["input_ids"]) for call in model_calls) == 8
+    assert all(results)
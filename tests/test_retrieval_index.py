@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from retrieval_index import DenseIndex, TfidfIndex
+
+
+def _texts(prefix, count):
+    return [f"{prefix} chunk {i} about topic{i % 7} and subject{i % 5} with detail{i}" for i in range(count)]
+
+
+def test_tfidf_index_reuses_stored_chunks_when_new_ones_come_first(tmp_path):
+    path = str(tmp_path / "tfidf")
+    sources = _texts("source", 40)
+    TfidfIndex(path).build(sources)
+
+    # Summaries are indexed before the source chunks, so new material is not at the end
+    texts = _texts("summary", 3) + sources
+    index = TfidfIndex(path).build(texts)
+    assert index.fitted_count == 40
+    assert index.drift == 3
+    assert index.term_chunks.shape[1] == len(texts)
+
+    expected = index.vectorizer.transform(texts).T.toarray()
+    assert np.allclose(index.term_chunks.toarray(), expected)
+
+
+def test_tfidf_index_refits_after_too_much_drift(tmp_path):
+    path = str(tmp_path / "tfidf")
+    TfidfIndex(path).build(_texts("source", 40))
+    index = TfidfIndex(path).build(_texts("other", 40))
+    assert index.fitted_count == 40
+    assert index.drift == 0
+
+
+class CountingEmbedder:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        # Deterministic unit vectors, one per text
+        vectors = np.array([[len(text), sum(map(ord, text)) % 97, 1.0] for text in texts], dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_dense_index_embeds_only_new_chunks(tmp_path):
+    path = str(tmp_path / "embeddings")
+    sources = _texts("source", 10)
+    DenseIndex(CountingEmbedder(), path, model_id="test").build(sources)
+
+    embedder = CountingEmbedder()
+    texts = _texts("summary", 2) + sources[:8]
+    index = DenseIndex(embedder, path, model_id="test").build(texts)
+    assert embedder.encoded == texts[:2]
+    expected = np.asarray(CountingEmbedder().encode(texts), dtype=np.float16)
+    assert np.array_equal(np.asarray(index.vectors), expected)
+
+    embedder = CountingEmbedder()
+    DenseIndex(embedder, path, model_id="other").build(texts)
+    assert embedder.encoded == texts
+
+
+def test_dense_index_requires_a_path():
+    with pytest.raises(ValueError):
+        DenseIndex(CountingEmbedder(), None)
@@ -0,0 +1,42 @@
+import pytest
+from summarization import HierarchicalSummarizer
+
+
+class WordTokenizer:
+    model_max_length = 1024
+
+    def encode(self, text, add_special_tokens=False):
+        return text.split()
+
+    def decode(self, ids):
+        return " ".join(ids)
+
+    def num_special_tokens_to_add(self):
+        return 0
+
+    def __call__(self, texts, add_special_tokens=False):
+        return {"input_ids": [text.split() for text in texts]}
+
+
+def fake_summarizer(texts, **kwargs):
+    return [{"summary_text": text[:20]} for text in texts]
+
+
+@pytest.mark.parametrize("piece_words", [3, 10, 19, 40])
+def test_chunks_never_exceed_chunk_tokens(piece_words):
+    tokenizer = WordTokenizer()
+    summarizer = HierarchicalSummarizer(summarizer=None, chunk_tokens=100, overlap_tokens=20, tokenizer=tokenizer)
+    sentences = [" ".join(f"w{i}_{j}" for j in range(piece_words)) + "." for i in range(60)]
+    chunks = list(summarizer.iter_chunks(" ".join(sentences)))
+    assert len(chunks) > 1
+    assert max(len(tokenizer.encode(chunk)) for chunk in chunks) <= 100
+
+
+def test_progress_is_reported_after_every_batch():
+    progress = []
+    summarizer = HierarchicalSummarizer(fake_summarizer, batch_size=4, chunk_tokens=100, tokenizer=WordTokenizer(),
+                                        on_progress=lambda done, total: progress.append((done, total)))
+    summaries = summarizer.summarize([f"page {i} about some topic." for i in range(20)])
+    assert len(summaries) == 20
+    assert [done for done, _ in progress if 0 < done < 20] == [4, 8, 12, 16]
+    assert progress[-1] == (20, 20)
@@ -0,0 +1,13 @@
+from vocabulary import build_vocabulary, combine_backgrounds, english_background
+
+
+def test_english_background_ranks_domain_terms_above_common_words():
+    texts = ["The chlorophyll in the leaf absorbs light. Chlorophyll makes the leaf green, like other green things."]
+    ranked = [word for word, _ in build_vocabulary(texts, background=english_background())]
+    assert ranked[0] == "chlorophyll"
+    assert ranked.index("leaf") < ranked.index("things")
+
+
+def test_combined_backgrounds_weigh_each_table_equally():
+    combined = combine_backgrounds({"cell": 900, "atom": 100}, {"cell": 1, "gene": 1})
+    assert combined == {"cell": 1400, "atom": 100, "gene": 500}